@@ -0,0 +1,361 @@
+"""
+Bulk ingestion CLI for backfilling directories of 10-K filings.
+
+Runs the same stages as `POST /upload-doc` as a pipeline: PDFs are parsed in a process pool,
+chunks are embedded in batches, and vectors are upserted in batches on a separate thread.
+Progress is checkpointed by content-hash doc_id, so an interrupted run can be resumed.
+
+Usage (from the backend directory):
+    python -m app.ingest path/to/filings --workers 4 --visualize
+    python -m app.ingest --manifest filings.txt
+"""
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import threading
+import multiprocessing
+import concurrent.futures
+from typing import Iterator, List, Set, Dict, Tuple, Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# A backfill must not wipe the vectors it (or a previous run) already stored, whatever .env says
+_SERVER_RESETS_DATA = os.getenv("DOC_VISUALIZER_RESET_ON_RESTART", "true").lower() == "true"
+os.environ["DOC_VISUALIZER_RESET_ON_RESTART"] = "false"
+
+# Only the parsing stages are imported at module level. Parse workers are spawned processes that
+# re-import this module, and must not create OpenAI / Pinecone clients.
+from .services.compaction import scan_pdf, compacted_chunks_from_pdf
+from .services.lexical_index import build_lexical_index
+
+TEMP_DIRECTORY = os.getenv("TEMP_DIRECTORY", "/tmp")
+DEFAULT_CHECKPOINT_PATH = os.path.join(TEMP_DIRECTORY, "doc_visualizer_ingest_checkpoint.jsonl")
+
+# Embedded micro-batches waiting to be upserted, before the embed stage blocks
+MAX_PENDING_STORE_BATCHES = 4
+
+STAGE_STORED = "stored"
+STAGE_VISUALIZED = "visualized"
+
+
+def _parse_document(doc_id: str, path: str) -> Tuple[str, str, List[str], List[int]]:
+    """
+    Parse stage, run in a worker process. Also builds the local lexical index.
+    Pages are streamed from the PDF, but the compacted text of the whole document is returned to the main
+    process, which holds at most workers * 2 parsed documents.
+    """
+    scan = scan_pdf(path)
+    chunks = compacted_chunks_from_pdf(path, scan.boilerplate)
+    build_lexical_index(doc_id, chunks)
+    return doc_id, path, chunks, scan.signature
+
+
+class Checkpoint:
+    """
+    Append-only JSONL log of the last completed stage for each doc_id.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stages: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    record = json.loads(line)
+                    # Never move a document back from visualized to stored
+                    if self.stages.get(record["doc_id"]) != STAGE_VISUALIZED:
+                        self.stages[record["doc_id"]] = record["stage"]
+
+    def record(self, doc_id: str, path: str, stage: str) -> None:
+        with self._lock:
+            self.stages[doc_id] = stage
+            with open(self.path, 'a') as f:
+                f.write(json.dumps({"doc_id": doc_id, "path": path, "stage": stage}) + "\n")
+
+
+def collect_pdf_paths(directory: Optional[str], manifest: Optional[str]) -> List[str]:
+    """
+    Collect PDF paths from a directory (searched recursively) and/or a manifest with one path per line.
+    """
+    paths = []
+    if directory:
+        paths.extend(sorted(glob.glob(os.path.join(directory, "**", "*.pdf"), recursive=True)))
+    if manifest:
+        with open(manifest, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    paths.append(line)
+    return paths
+
+
+def _doc_id_for_path(path: str) -> str:
+    from .routers.upload import doc_id_for_content
+
+    with open(path, 'rb') as f:
+        return doc_id_for_content(f.read())
+
+
+def _find_near_duplicate(signature: List[int]) -> Optional[str]:
+    from .services.dedup import near_duplicate_index
+    from .services.vector_store import has_stored_embeddings
+
+    near_duplicate = near_duplicate_index.find(signature)
+    if near_duplicate and has_stored_embeddings(near_duplicate[0]):
+        return near_duplicate[0]
+    return None
+
+
+def _store_batch(
+    doc_id: str,
+    start_index: int,
+    chunks: List[str],
+    embeddings: List[List[float]],
+    upsert_batch_size: int
+) -> None:
+    from .services.vector_store import upsert_embeddings
+
+    upsert_embeddings(doc_id, chunks, embeddings, start_index=start_index, batch_size=upsert_batch_size)
+
+
+def _finish_document(doc_id: str, chunks: List[str], signature: List[int]) -> None:
+    from .services.dedup import near_duplicate_index
+    from .services.vector_store import finish_embeddings
+
+    finish_embeddings(doc_id)
+    near_duplicate_index.add(doc_id, chunks, signature)
+
+
+def _visualize_document(doc_id: str, model: str) -> None:
+    from .routers.upload import pdf_path_for_doc_id
+    from .routers.visualization import generate_visualization
+    from .services.cache import visualization_cache
+
+    if visualization_cache.get_bytes(doc_id, model) is not None:
+        return
+    generate_visualization(doc_id, pdf_path_for_doc_id(doc_id), model)
+
+
+def run_ingest(
+    paths: List[str],
+    checkpoint_path: str = DEFAULT_CHECKPOINT_PATH,
+    workers: int = 4,
+    embed_batch_size: int = 64,
+    upsert_batch_size: int = 100,
+    visualize: bool = False,
+    visualize_workers: int = 2,
+    model: str = "o3-mini"
+) -> None:
+    """
+    Ingest PDFs as a pipeline: parse (process pool) -> embed (main thread) -> upsert (store thread)
+    -> optionally generate visualizations (visualize threads).
+    Embeddings flow from the embed stage to the store stage in micro-batches of embed_batch_size chunks,
+    and at most MAX_PENDING_STORE_BATCHES batches are waiting at a time, so memory stays bounded.
+    """
+    from .routers.upload import pdf_path_for_doc_id, iter_embedding_batches
+
+    checkpoint = Checkpoint(checkpoint_path)
+    target_stage = STAGE_VISUALIZED if visualize else STAGE_STORED
+
+    # Resolve doc_ids up front so completed documents are skipped before any parsing work
+    to_parse: List[Tuple[str, str]] = []
+    to_visualize: List[Tuple[str, str]] = []
+    seen: Set[str] = set()
+    for path in paths:
+        try:
+            doc_id = _doc_id_for_path(path)
+        except OSError as e:
+            print(f"[ingest] Skipping {path}: {e}")
+            continue
+        if doc_id in seen:
+            continue
+        seen.add(doc_id)
+
+        stage = checkpoint.stages.get(doc_id)
+        if stage == target_stage or stage == STAGE_VISUALIZED:
+            continue
+        if stage == STAGE_STORED:
+            to_visualize.append((doc_id, path))
+        else:
+            to_parse.append((doc_id, path))
+
+    total = len(to_parse) + len(to_visualize)
+    print(f"[ingest] {len(paths)} files, {len(seen) - total} already done, "
+          f"{len(to_parse)} to ingest, {len(to_visualize)} to visualize")
+    if total == 0:
+        return
+
+    started = time.monotonic()
+    completed = 0
+    failed = 0
+    progress_lock = threading.Lock()
+
+    def report_done(doc_id: str, error: Optional[Exception] = None) -> None:
+        nonlocal completed, failed
+        with progress_lock:
+            if error is None:
+                completed += 1
+            else:
+                failed += 1
+                print(f"[ingest] Failed {doc_id}: {error}")
+            elapsed_min = (time.monotonic() - started) / 60
+            rate = completed / elapsed_min if elapsed_min > 0 else 0.0
+            print(f"[ingest] {completed + failed}/{total} done ({failed} failed), {rate:.1f} docs/min")
+
+    store_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    visualize_pool = concurrent.futures.ThreadPoolExecutor(max_workers=visualize_workers) if visualize else None
+
+    def visualize_stage(doc_id: str, path: str) -> None:
+        try:
+            _visualize_document(doc_id, model)
+            checkpoint.record(doc_id, path, STAGE_VISUALIZED)
+            report_done(doc_id)
+        except Exception as e:
+            report_done(doc_id, e)
+
+    # Documents that failed in any stage, read by the embed loop and the store thread
+    failed_docs: Set[str] = set()
+    store_slots = threading.BoundedSemaphore(MAX_PENDING_STORE_BATCHES)
+
+    def has_failed(doc_id: str) -> bool:
+        with progress_lock:
+            return doc_id in failed_docs
+
+    def fail_document(doc_id: str, error: Exception) -> None:
+        # A document is reported once, even if several of its stages fail
+        with progress_lock:
+            if doc_id in failed_docs:
+                return
+            failed_docs.add(doc_id)
+        report_done(doc_id, error)
+
+    def store_batch_stage(doc_id: str, start_index: int, chunks: List[str], embeddings: List[List[float]]) -> None:
+        try:
+            if not has_failed(doc_id):
+                _store_batch(doc_id, start_index, chunks, embeddings, upsert_batch_size)
+        except Exception as e:
+            fail_document(doc_id, e)
+        finally:
+            store_slots.release()
+
+    def chunks_until_failed(doc_id: str, chunks: List[str]) -> Iterator[str]:
+        # Chunks are pulled lazily by the embed stage, so nothing more is embedded once a store has failed
+        for chunk in chunks:
+            if has_failed(doc_id):
+                return
+            yield chunk
+
+    def finish_stage(doc_id: str, path: str, chunks: List[str], signature: List[int]) -> None:
+        if has_failed(doc_id):
+            return
+        try:
+            _finish_document(doc_id, chunks, signature)
+            checkpoint.record(doc_id, path, STAGE_STORED)
+        except Exception as e:
+            fail_document(doc_id, e)
+            return
+        if visualize_pool is not None:
+            visualize_pool.submit(visualize_stage, doc_id, path)
+        else:
+            report_done(doc_id)
+
+    for doc_id, path in to_visualize:
+        visualize_pool.submit(visualize_stage, doc_id, path)
+
+    # Spawn rather than fork, so workers don't inherit gRPC / HTTP client state from this process
+    mp_context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as parse_pool:
+        pending = iter(to_parse)
+        in_flight: Dict[concurrent.futures.Future, str] = {}
+
+        def fill_window() -> None:
+            # Bound the number of parsed-but-not-embedded documents held in memory
+            while len(in_flight) < workers * 2:
+                try:
+                    doc_id, path = next(pending)
+                except StopIteration:
+                    return
+                in_flight[parse_pool.submit(_parse_document, doc_id, path)] = doc_id
+
+        fill_window()
+        while in_flight:
+            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                failed_doc_id = in_flight.pop(future)
+                try:
+                    doc_id, path, chunks, signature = future.result()
+                    # The visualization endpoint expects the PDF at its doc_id path
+                    pdf_path = pdf_path_for_doc_id(doc_id)
+                    if not os.path.exists(pdf_path):
+                        shutil.copyfile(path, pdf_path)
+                    batches = iter_embedding_batches(
+                        chunks_until_failed(doc_id, chunks),
+                        near_duplicate_of=_find_near_duplicate(signature),
+                        batch_size=embed_batch_size
+                    )
+                    for start_index, batch, embeddings in batches:
+                        store_slots.acquire()
+                        if has_failed(doc_id):
+                            store_slots.release()
+                            break
+                        store_pool.submit(store_batch_stage, doc_id, start_index, batch, embeddings)
+                except Exception as e:
+                    # Batches already submitted are harmless: the document isn't checkpointed and is redone on resume
+                    fail_document(failed_doc_id, e)
+                    continue
+                if has_failed(doc_id):
+                    continue
+                store_pool.submit(finish_stage, doc_id, path, chunks, signature)
+            fill_window()
+
+    store_pool.shutdown(wait=True)
+    if visualize_pool is not None:
+        visualize_pool.shutdown(wait=True)
+
+    elapsed_min = (time.monotonic() - started) / 60
+    rate = completed / elapsed_min if elapsed_min > 0 else 0.0
+    print(f"[ingest] Finished: {completed} succeeded, {failed} failed in {elapsed_min:.1f} min ({rate:.1f} docs/min)")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Bulk ingest a directory or manifest of 10-K PDFs.")
+    parser.add_argument("directory", nargs="?", help="Directory to search recursively for PDFs")
+    parser.add_argument("--manifest", help="File listing one PDF path per line")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH, help="Checkpoint file used to resume runs")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="Parse processes")
+    parser.add_argument("--embed-batch-size", type=int, default=64, help="Chunks per embeddings request")
+    parser.add_argument("--upsert-batch-size", type=int, default=100, help="Vectors per Pinecone upsert")
+    parser.add_argument("--visualize", action="store_true", help="Pre-generate visualizations into the cache")
+    parser.add_argument("--visualize-workers", type=int, default=2, help="Documents visualized concurrently")
+    parser.add_argument("--model", default=os.getenv("OAI_MODEL", "o3-mini"), help="Model used for visualizations")
+    args = parser.parse_args(argv)
+
+    if not args.directory and not args.manifest:
+        parser.error("Provide a directory and/or --manifest")
+    if _SERVER_RESETS_DATA:
+        print("[ingest] Warning: DOC_VISUALIZER_RESET_ON_RESTART is true, so the server will empty the index "
+              "and the visualization cache when it restarts. Set it to false to keep backfilled documents.")
+
+    run_ingest(
+        collect_pdf_paths(args.directory, args.manifest),
+        checkpoint_path=args.checkpoint,
+        workers=args.workers,
+        embed_batch_size=args.embed_batch_size,
+        upsert_batch_size=args.upsert_batch_size,
+        visualize=args.visualize,
+        visualize_workers=args.visualize_workers,
+        model=args.model
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -5,18 +5,24 @@ load_dotenv()
 from fastapi import FastAPI
 
 from .routers import upload, visualization
-from .services.clients import init_pinecone, cleanup_pinecone
+from .services.clients import init_pinecone, cleanup_pinecone, RESET_ON_RESTART
 from .services.cache import visualization_cache
+from .services.dedup import near_duplicate_index
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # The index was emptied on startup, so previously ingested documents can't be reused as near-duplicates
+    if RESET_ON_RESTART:
+        near_duplicate_index.clear()
 
     yield # Server starts
 
-    # Clean up resources when the server shuts down
-    cleanup_pinecone()
-    visualization_cache.clear_cache()
-    print("All cleanup operations completed.")
+    # Clean up resources when the server shuts down, unless stored documents should survive restarts
+    if RESET_ON_RESTART:
+        cleanup_pinecone()
+        visualization_cache.clear_cache()
+        near_duplicate_index.clear()
+        print("All cleanup operations completed.")
 
 app = FastAPI(
     title="doc-visualizer-backend",
@@ -1,30 +1,39 @@
 import os
 import hashlib
+from itertools import islice
+from typing import Iterable, List, Optional, Iterator, Tuple
 from fastapi import APIRouter, File, UploadFile, HTTPException, BackgroundTasks
 
-from ..services.parsing import chunk_text_from_pdf
+from ..services.compaction import DocumentScan, scan_pdf, iter_compacted_pages
 from ..services.embeddings import get_embedding
-from ..services.vector_store import upsert_embeddings
+from ..services.vector_store import upsert_embeddings, finish_embeddings, fetch_embeddings, has_stored_embeddings
+from ..services.lexical_index import build_lexical_index
+from ..services.dedup import near_duplicate_index
 
 router = APIRouter()
 
 TEMP_DIRECTORY = os.getenv("TEMP_DIRECTORY", "/tmp")
 
 @router.post("/upload-doc")
-async def upload_doc(file: UploadFile = File(...), background_tasks: BackgroundTasks = None):
+async def upload_doc(
+    file: UploadFile = File(...),
+    background_tasks: BackgroundTasks = None,
+    reuse_existing: bool = False
+):
+    """
+    Upload a PDF and store its embeddings.
+    If it is a near-duplicate of an ingested document (e.g. a re-export or an amendment), only changed pages
+    are embedded. With reuse_existing, the existing document's ID is returned instead, without ingesting.
+    """
     if file.content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="Only PDF files are supported.")
 
     # Generate a deterministic document ID based solely on content hash
     file_content = await file.read()
-    # Using the full MD5 hash for better uniqueness
-    content_hash = hashlib.md5(file_content).hexdigest()
-    
-    # Create an ID that depends only on the content
-    doc_id = f"doc_{content_hash}"
+    doc_id = doc_id_for_content(file_content)
     
     # Check if a file with this hash already exists
-    file_path = f"{TEMP_DIRECTORY}/{doc_id}.pdf"
+    file_path = pdf_path_for_doc_id(doc_id)
     
     # Skip processing if the file already exists
     if os.path.exists(file_path):
@@ -34,20 +43,106 @@ async def upload_doc(file: UploadFile = File(...), background_tasks: BackgroundT
     with open(file_path, "wb") as f:
         f.write(file_content)
 
+    # First pass over the pages: find running headers / footers and look for a near-duplicate among the
+    # documents we already ingested
+    scan = scan_pdf(file_path)
+    near_duplicate = near_duplicate_index.find(scan.signature, exclude_doc_id=doc_id)
+    # Only a document whose vectors are still stored can be reused
+    if near_duplicate and not has_stored_embeddings(near_duplicate[0]):
+        near_duplicate = None
+
+    if near_duplicate and reuse_existing:
+        existing_doc_id, similarity = near_duplicate
+        os.remove(file_path)
+        return {
+            "message": "Near-duplicate of an existing document",
+            "doc_id": existing_doc_id,
+            "similarity": similarity
+        }
+
     # Blocking, so that we don't try to make the visualization until the document is uploaded
-    parse_and_store_document(doc_id, file_path)
+    parse_and_store_document(
+        doc_id, file_path, scan=scan, near_duplicate_of=near_duplicate[0] if near_duplicate else None
+    )
     # background_tasks.add_task(parse_and_store_document, doc_id, file_path)
 
-    return {"message": "File uploaded successfully", "doc_id": doc_id}
+    response = {"message": "File uploaded successfully", "doc_id": doc_id}
+    if near_duplicate:
+        response["near_duplicate_of"], response["similarity"] = near_duplicate
+    return response
+
+def doc_id_for_content(file_content: bytes) -> str:
+    """Create a document ID that depends only on the content (full MD5 hash for better uniqueness)."""
+    content_hash = hashlib.md5(file_content).hexdigest()
+    return f"doc_{content_hash}"
+
+def pdf_path_for_doc_id(doc_id: str) -> str:
+    """Path where the PDF for a document ID is stored."""
+    return f"{TEMP_DIRECTORY}/{doc_id}.pdf"
+
+def iter_embedding_batches(
+    text_chunks: Iterable[str],
+    near_duplicate_of: Optional[str] = None,
+    batch_size: int = 64
+) -> Iterator[Tuple[int, List[str], List[List[float]]]]:
+    """
+    Embed text chunks in micro-batches, yielding (start_index, chunks, embeddings) for each batch so callers can
+    store it before the next batch is embedded. Chunks are consumed lazily, so they can be streamed from a PDF,
+    and only one batch of embeddings is held in memory at a time.
+    Chunks identical to a page of near_duplicate_of reuse its stored embeddings.
+    """
+    chunks = iter(text_chunks)
+    start = 0
+    reused_count = 0
+    while True:
+        batch = list(islice(chunks, batch_size))
+        if not batch:
+            break
+        embeddings: List[Optional[List[float]]] = [None] * len(batch)
+
+        reused = near_duplicate_index.matching_pages(near_duplicate_of, batch) if near_duplicate_of else {}
+        if reused:
+            stored = fetch_embeddings(near_duplicate_of, sorted(set(reused.values())))
+            for k, j in reused.items():
+                embeddings[k] = stored.get(j)
+            reused_count += sum(1 for embedding in embeddings if embedding is not None)
+
+        to_embed = [k for k, embedding in enumerate(embeddings) if embedding is None]
+        if to_embed:
+            for k, embedding in zip(to_embed, get_embedding([batch[k] for k in to_embed])):
+                embeddings[k] = embedding
+        yield start, batch, embeddings
+        start += len(batch)
+
+    if near_duplicate_of:
+        print(f"Reused {reused_count}/{start} embeddings from {near_duplicate_of}")
 
-def parse_and_store_document(doc_id: str, file_path: str):
-    """Parse a PDF document and store its embeddings in Pinecone."""
+def parse_and_store_document(
+    doc_id: str,
+    file_path: str,
+    scan: Optional[DocumentScan] = None,
+    near_duplicate_of: Optional[str] = None
+):
+    """
+    Parse a PDF document and store its embeddings in Pinecone.
+    Pages are streamed from the PDF twice: scan_pdf finds running headers / footers (unless a scan is given),
+    then each page is compacted, embedded and stored in micro-batches, so parsed pages and embeddings never
+    accumulate. Only the compacted text is kept for the whole document, for the lexical index and near-duplicate
+    detection.
+    """
+    if scan is None:
+        scan = scan_pdf(file_path)
 
-    # Extract text from PDF
-    text_chunks = chunk_text_from_pdf(file_path)
+    # Convert text chunks to embeddings and store them in Pinecone, one micro-batch at a time
+    text_chunks: List[str] = []
+    pages = iter_compacted_pages(file_path, scan.boilerplate)
+    for start_index, chunks, embeddings in iter_embedding_batches(pages, near_duplicate_of=near_duplicate_of):
+        upsert_embeddings(doc_id, chunks, embeddings, start_index=start_index)
+        text_chunks.extend(chunks)
+    finish_embeddings(doc_id)
 
-    # Convert text chunks to embeddings
-    embeddings = get_embedding(text_chunks, model="text-embedding-3-small")
+    # Build the local lexical index used for BM25 / hybrid retrieval
+    build_lexical_index(doc_id, text_chunks)
 
-    # Store in Pinecone
-    upsert_embeddings(doc_id, text_chunks, embeddings)
+    # Make the document available for near-duplicate detection
+    near_duplicate_index.add(doc_id, text_chunks, scan.signature)
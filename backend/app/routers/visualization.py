@@ -1,12 +1,20 @@
 import os
-from fastapi import APIRouter, HTTPException, Body
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Body, Response, Request
+from fastapi.responses import FileResponse
 
 from ..services.analysis import find_section_insights
-from ..services.visualize import make_visualization, VisualResponse
+from ..services.visualize import make_visualization, regenerate_modules, visualization_module_ids, VisualResponse
 from ..services.cache import visualization_cache
+from ..services.chart_routing import chart_routing_stats
 
 router = APIRouter()
 
+# Versioned URLs never change content, so they can be cached for a year
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# The latest version of a document may be patched by module regeneration, so it must be revalidated
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
 @router.post("/generate-visualization")
 def visualize_doc(doc_id: str = Body(..., embed=True)) -> VisualResponse:
     """
@@ -23,24 +31,150 @@ def visualize_doc(doc_id: str = Body(..., embed=True)) -> VisualResponse:
     # Default model to use
     model = os.getenv("OAI_MODEL", "o3-mini")
     
-    # Try to get the visualization from cache
-    cached_visualization = visualization_cache.get(doc_id, model)
+    # Try to get the visualization from cache. The stored bytes are already JSON, so serve them as-is
+    cached_visualization = visualization_cache.get_bytes(doc_id, model)
     if cached_visualization:
-        return cached_visualization
+        etag = visualization_cache.get_etag(doc_id, model)
+        headers = {"ETag": etag, "Content-Location": _versioned_url(doc_id, etag)} if etag else None
+        return Response(content=cached_visualization, media_type="application/json", headers=headers)
     
     # If not in cache, generate the visualization
     try:
-        insights = find_section_insights(pdf_path, model=model)
-        visualization = make_visualization(insights, doc_id, model=model)
-        
-        # Cache the visualization for future use
-        visualization_cache.set(doc_id, model, visualization)
-        
-        return visualization
+        return generate_visualization(doc_id, pdf_path, model)
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/regenerate-visualization-modules")
+def regenerate_visualization_modules(
+    doc_id: str = Body(...),
+    module_ids: Optional[List[str]] = Body(None)
+) -> VisualResponse:
+    """
+    Regenerates only some modules of a cached VisualResponse and patches the cache.
+    If module_ids is omitted, all degraded (TextCard fallback) modules are regenerated.
+    The section insights of the original generation are reused.
+    """
+    if not doc_id:
+        raise HTTPException(status_code=400, detail="Missing doc_id")
+
+    model = os.getenv("OAI_MODEL", "o3-mini")
+
+    visualization = visualization_cache.get(doc_id, model)
+    insights = visualization_cache.get_insights(doc_id, model)
+    if not visualization or not insights:
+        raise HTTPException(status_code=404, detail="No cached visualization to regenerate.")
+
+    if module_ids is not None:
+        known_ids = set(visualization_module_ids(visualization))
+        unknown_ids = [module_id for module_id in module_ids if module_id not in known_ids]
+        if unknown_ids:
+            raise HTTPException(status_code=400, detail=f"Unknown module_ids: {', '.join(unknown_ids)}")
+
+    try:
+        visualization, regenerated = regenerate_modules(
+            visualization, insights, doc_id, model=model, module_cache=visualization_cache, module_ids=module_ids
+        )
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail=str(e))
 
+    if regenerated:
+        visualization_cache.set(doc_id, model, visualization)
+    print(f"Regenerated {len(regenerated)} modules for document {doc_id}")
+    return visualization
+
+@router.get("/chart-routing-stats")
+def get_chart_routing_stats() -> dict:
+    """
+    Per-tier call counts and latency of chart spec generation, and how often the fast tier escalated.
+    """
+    return chart_routing_stats.snapshot()
+
+@router.get("/visualizations/{doc_id}")
+def get_visualization(doc_id: str, request: Request) -> Response:
+    """
+    Cacheable read of a finished visualization. Does not generate anything: returns 404 until
+    /generate-visualization has been called for the document.
+    Responds with a strong ETag, handles If-None-Match, and serves precompressed bodies when accepted.
+    """
+    return _cached_visualization_response(doc_id, request, REVALIDATE_CACHE_CONTROL)
+
+@router.get("/visualizations/{doc_id}/{version}")
+def get_visualization_version(doc_id: str, version: str, request: Request) -> Response:
+    """
+    Content-addressed read of a finished visualization, where version is its ETag value.
+    Returns 404 if the visualization has changed since, so the URL can be cached forever.
+    """
+    return _cached_visualization_response(doc_id, request, IMMUTABLE_CACHE_CONTROL, version=version)
+
+def _cached_visualization_response(doc_id: str, request: Request, cache_control: str, version: Optional[str] = None) -> Response:
+    model = os.getenv("OAI_MODEL", "o3-mini")
+
+    etag = visualization_cache.get_etag(doc_id, model)
+    if etag is None or (version is not None and etag != f'"{version}"'):
+        raise HTTPException(status_code=404, detail="Visualization not found.")
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+        "Content-Location": _versioned_url(doc_id, etag),
+    }
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    # Serve a precompressed body straight from disk if the client accepts it
+    accepted = {
+        encoding.split(";")[0].strip().lower()
+        for encoding in request.headers.get("accept-encoding", "").split(",")
+    }
+    for encoding in ("br", "gzip"):
+        if encoding in accepted:
+            body_path = visualization_cache.get_response_body_path(doc_id, model, encoding, etag)
+            if body_path:
+                return FileResponse(
+                    body_path,
+                    media_type="application/json",
+                    headers={**headers, "Content-Encoding": encoding}
+                )
+
+    # Missing if the visualization was replaced since its ETag was read
+    body = visualization_cache.get_bytes(doc_id, model, etag=etag)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Visualization not found.")
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _versioned_url(doc_id: str, etag: str) -> str:
+    version = etag.strip('"')
+    return f"/visualizations/{doc_id}/{version}"
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches the ETag (weak comparison, as RFC 9110 requires for If-None-Match).
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in [candidate.removeprefix("W/") for candidate in candidates]
+
+def generate_visualization(doc_id: str, pdf_path: str, model: str) -> VisualResponse:
+    """
+    Generate a visualization and cache it along with its insights and modules.
+    Insights and non-degraded modules from a previous generation are reused.
+    """
+    insights = visualization_cache.get_insights(doc_id, model)
+    if insights is None:
+        insights = find_section_insights(pdf_path, model=model, doc_id=doc_id)
+        visualization_cache.set_insights(doc_id, model, insights)
+
+    visualization = make_visualization(insights, doc_id, model=model, module_cache=visualization_cache)
+
+    # Cache the visualization for future use
+    visualization_cache.set(doc_id, model, visualization)
+    return visualization
+
 def _pdf_path_for_doc_id(doc_id: str) -> str:
     """
     Construct the path where the PDF was saved after upload.
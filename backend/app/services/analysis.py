@@ -1,7 +1,9 @@
+from typing import Optional
 from pydantic import BaseModel
 
 from .clients import get_openai_client
-from .parsing import chunk_text_from_pdf
+from .compaction import compacted_chunks_from_pdf
+from .lexical_index import get_chunk_texts
 
 class Insight(BaseModel):
     name: str
@@ -20,14 +22,19 @@ class InsightsReponse(BaseModel):
     risk_factors: Section
     market_position: Section
 
-def find_section_insights(path: str, model: str = "o3-mini") -> InsightsReponse:
+def find_section_insights(path: str, model: str = "o3-mini", doc_id: Optional[str] = None) -> InsightsReponse:
     """
     Prompt model for the sections of the document and the most important insights for each section.
     :param path: The path to the document.
+    :param doc_id: The document's ID, to reuse the chunks stored when it was ingested.
     :return: A list of the sections of the 10K with insights for each section.
     """
 
-    text_chunks = chunk_text_from_pdf(path)
+    # Compacted view without repeated headers / footers, table of contents and exhibit index pages.
+    # It was built and stored at ingest time; the PDF is only parsed again if it is missing.
+    text_chunks = get_chunk_texts(doc_id) if doc_id else None
+    if not text_chunks:
+        text_chunks = compacted_chunks_from_pdf(path)
     full_text = "\n\n".join(text_chunks)
 
     client = get_openai_client()
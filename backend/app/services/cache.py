@@ -1,33 +1,132 @@
 import os
 import json
 import glob
-from typing import Optional, List, Tuple
+import gzip
+import struct
+from typing import Optional, List, Tuple, Any, Dict, Type, get_args
 import hashlib
+from functools import lru_cache
 
-from .visualize import VisualResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library encoder
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # Compression is optional
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # Brotli response bodies are optional
+    brotli = None
+
+from .analysis import InsightsReponse
+from .visualize import (
+    VisualResponse, VisualSection, VisualModule, DataSeries,
+    BarChart, PieChart, GaugeChart, SingleStatCard, LineChart, MultiSeriesBarChart, TextCard
+)
 
 # Get cache configuration from environment variables with defaults
 TEMP_DIRECTORY = os.getenv("TEMP_DIRECTORY", "/tmp")
 CACHE_DIR = os.getenv("DOC_VISUALIZER_CACHE_DIR", os.path.join(TEMP_DIRECTORY, "doc_visualizer_cache"))
 MAX_CACHE_SIZE_MB = int(os.getenv("DOC_VISUALIZER_MAX_CACHE_SIZE_MB", "500"))
+# "zstd" or "none". zstd is only used if the zstandard package is installed.
+CACHE_COMPRESSION = os.getenv("DOC_VISUALIZER_CACHE_COMPRESSION", "zstd").lower()
+
+# On-disk entry layout:
+#   magic (4s) | format version (B) | codec (B) | schema hash (16s) | payload digest (16s) | payload
+# The payload is the JSON encoding of the cached model, optionally zstd compressed.
+CACHE_FILE_EXTENSION = ".dvc"
+_CACHE_MAGIC = b"DVC1"
+_CACHE_FORMAT_VERSION = 1
+_CACHE_HEADER = struct.Struct(">4sBB16s16s")
+_CODEC_NONE = 0
+_CODEC_ZSTD = 1
+
+# Precompressed HTTP response bodies stored next to full visualization entries, by Content-Encoding.
+# Bodies are named "<cache key>.<payload digest><extension>", so a body always matches the ETag it is served with.
+RESPONSE_BODY_EXTENSIONS = {"br": ".json.br", "gzip": ".json.gz"}
+
+_CHART_TYPES = {
+    get_args(chart_cls.model_fields["chart_type"].annotation)[0]: chart_cls
+    for chart_cls in (BarChart, PieChart, GaugeChart, SingleStatCard, LineChart, MultiSeriesBarChart, TextCard)
+}
+
+@lru_cache(maxsize=None)
+def schema_hash(model_cls: Type[BaseModel]) -> bytes:
+    """
+    Hash of the JSON schema of a model. Changes whenever a field is added, removed or retyped,
+    which lets us detect cache entries written by an older version of the model.
+    """
+    schema = json.dumps(model_cls.model_json_schema(), sort_keys=True)
+    return hashlib.md5(schema.encode()).digest()
+
+def _dumps(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode()
+
+def _loads(payload: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+def _construct_chart(data: Dict[str, Any]):
+    chart_cls = _CHART_TYPES[data["chart_type"]]
+    if chart_cls is MultiSeriesBarChart:
+        data = {**data, "series": [DataSeries.model_construct(**series) for series in data["series"]]}
+    return chart_cls.model_construct(**data)
+
+def _construct_module(data: Dict[str, Any]) -> VisualModule:
+    return VisualModule.model_construct(**{**data, "chart": _construct_chart(data["chart"])})
+
+def _construct_section(data: Dict[str, Any]) -> VisualSection:
+    modules = {
+        name: _construct_module(data[name])
+        for name in ("main_module", "side_module_1", "side_module_2")
+    }
+    return VisualSection.model_construct(**{**data, **modules})
+
+def construct_trusted_visual_response(data: Dict[str, Any]) -> VisualResponse:
+    """
+    Rebuild a VisualResponse from data that we wrote ourselves, skipping validation.
+    Only safe for cache entries whose schema hash matches the current VisualResponse.
+    """
+    sections = {
+        name: _construct_section(data[name])
+        for name in ("overview", "operational_performance", "risk_factors", "market_position")
+    }
+    return VisualResponse.model_construct(**{**data, **sections})
 
 class VisualizationCache:
     """
     Caches visualization data to avoid expensive regeneration.
     """
     
-    def __init__(self, cache_dir: str = CACHE_DIR, max_cache_size_mb: int = MAX_CACHE_SIZE_MB):
+    def __init__(
+        self,
+        cache_dir: str = CACHE_DIR,
+        max_cache_size_mb: int = MAX_CACHE_SIZE_MB,
+        compression: str = CACHE_COMPRESSION
+    ):
         """
         Initialize the cache service.
         
         Args:
             cache_dir: Directory to store cache files. Defaults to environment variable DOC_VISUALIZER_CACHE_DIR or a subdirectory in TEMP_DIRECTORY.
             max_cache_size_mb: Maximum cache size in MB. Defaults to environment variable DOC_VISUALIZER_MAX_CACHE_SIZE_MB or 500MB.
+            compression: "zstd" or "none". Defaults to environment variable DOC_VISUALIZER_CACHE_COMPRESSION or zstd.
         """
         self.cache_dir = cache_dir
         self.max_cache_size_mb = max_cache_size_mb
+        self.compression = compression
         # Create cache directory if it doesn't exist
         os.makedirs(self.cache_dir, exist_ok=True)
+        self._remove_legacy_entries()
         print(f"Visualization cache initialized at {self.cache_dir} with max size {self.max_cache_size_mb}MB")
     
     def _get_cache_key(self, doc_id: str, model: str) -> str:
@@ -57,11 +156,196 @@ class VisualizationCache:
             Path to the cache file
         """
         cache_key = self._get_cache_key(doc_id, model)
-        return os.path.join(self.cache_dir, f"{cache_key}.json")
+        return os.path.join(self.cache_dir, f"{cache_key}{CACHE_FILE_EXTENSION}")
+
+    def _remove_legacy_entries(self) -> None:
+        """
+        Remove entries written in the old plain JSON format, which are no longer read.
+        """
+        for path in glob.glob(os.path.join(self.cache_dir, "*.json")):
+            self._drop_entry(path, "legacy JSON cache format")
+
+    def _get_entry_path(self, kind: str, key: str, model: str) -> str:
+        """
+        Get the file path for a cache entry that is not a full visualization.
+        
+        Args:
+            kind: Kind of entry, e.g. "module" or "insights"
+            key: Key of the entry within its kind
+            model: Model used for generating the entry
+            
+        Returns:
+            Path to the cache file
+        """
+        cache_key = hashlib.md5(f"{kind}:{key}:{model}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{cache_key}{CACHE_FILE_EXTENSION}")
+
+    def _scan_entries(self) -> Dict[str, List[Tuple[str, int, float]]]:
+        """
+        List every entry file and precompressed response body in one pass over the cache directory,
+        grouped by entry path.
+
+        Returns:
+            Dict of entry path to (path, size in bytes, access time) of its files. The entry file itself may be
+            missing from a group, e.g. for bodies left behind by an interrupted write.
+        """
+        groups: Dict[str, List[Tuple[str, int, float]]] = {}
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if not (name.endswith(CACHE_FILE_EXTENSION) or name.endswith(tuple(RESPONSE_BODY_EXTENSIONS.values()))):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Removed since the directory was listed
+                # Cache keys are hex digests, so everything before the first dot is the key
+                cache_path = os.path.join(self.cache_dir, name.split(".", 1)[0] + CACHE_FILE_EXTENSION)
+                groups.setdefault(cache_path, []).append((entry.path, stat.st_size, stat.st_atime))
+        return groups
+
+    def _encode_entry(self, payload: bytes, model_cls: Type[BaseModel]) -> bytes:
+        """
+        Wrap a JSON payload in the compact on-disk format, stamped with the schema hash of model_cls.
+        """
+        digest = hashlib.md5(payload).digest()
+        codec = _CODEC_NONE
+        if self.compression == "zstd" and zstandard is not None:
+            payload = zstandard.ZstdCompressor().compress(payload)
+            codec = _CODEC_ZSTD
+        header = _CACHE_HEADER.pack(_CACHE_MAGIC, _CACHE_FORMAT_VERSION, codec, schema_hash(model_cls), digest)
+        return header + payload
+
+    def _read_header(self, cache_path: str, model_cls: Type[BaseModel], raw: Optional[bytes] = None) -> Optional[Tuple[int, bytes]]:
+        """
+        Read and check the header of a cache entry. Entries in an unknown format or written by an older schema
+        of model_cls are removed.
+        
+        Returns:
+            Tuple of the payload codec and payload digest, or None if the entry is missing or stale
+        """
+        if raw is None:
+            if not os.path.exists(cache_path):
+                return None
+            with open(cache_path, 'rb') as f:
+                raw = f.read(_CACHE_HEADER.size)
+
+        if len(raw) < _CACHE_HEADER.size:
+            self._drop_entry(cache_path, "truncated entry")
+            return None
+
+        magic, version, codec, entry_schema, digest = _CACHE_HEADER.unpack_from(raw)
+        if magic != _CACHE_MAGIC or version != _CACHE_FORMAT_VERSION:
+            self._drop_entry(cache_path, "unknown cache format")
+            return None
+        if entry_schema != schema_hash(model_cls):
+            self._drop_entry(cache_path, f"stale {model_cls.__name__} schema")
+            return None
+        if codec not in (_CODEC_NONE, _CODEC_ZSTD):
+            self._drop_entry(cache_path, f"unknown codec {codec}")
+            return None
+        return codec, digest
+
+    def _read_entry(self, cache_path: str, model_cls: Type[BaseModel]) -> Optional[Tuple[bytes, bytes]]:
+        """
+        Read a cache entry and return its (JSON payload, payload digest).
+        Entries in an unknown format or written by an older schema of model_cls are removed.
+        
+        Returns:
+            Tuple of the decompressed JSON payload and its digest, or None if the entry is missing or stale
+        """
+        if not os.path.exists(cache_path):
+            return None
+
+        with open(cache_path, 'rb') as f:
+            raw = f.read()
+
+        header = self._read_header(cache_path, model_cls, raw)
+        if header is None:
+            return None
+        codec, digest = header
+
+        payload = raw[_CACHE_HEADER.size:]
+        if codec == _CODEC_ZSTD:
+            if zstandard is None:
+                self._drop_entry(cache_path, "zstd entry but zstandard is not installed")
+                return None
+            payload = zstandard.ZstdDecompressor().decompress(payload)
+
+        # Update file access time
+        os.utime(cache_path, None)
+        return payload, digest
+
+    def _response_body_path(self, cache_path: str, digest: bytes, encoding: str) -> str:
+        return f"{cache_path[:-len(CACHE_FILE_EXTENSION)]}.{digest.hex()}{RESPONSE_BODY_EXTENSIONS[encoding]}"
+
+    def _response_body_files(self, cache_path: str) -> List[str]:
+        """
+        All precompressed response bodies stored for an entry, of any version.
+        """
+        base = glob.escape(cache_path[:-len(CACHE_FILE_EXTENSION)])
+        return [
+            path
+            for extension in RESPONSE_BODY_EXTENSIONS.values()
+            for path in glob.glob(f"{base}.*{extension}")
+        ]
+
+    def _entry_files(self, cache_path: str) -> List[str]:
+        """
+        The entry file and any precompressed response bodies stored next to it.
+        """
+        return [cache_path] + self._response_body_files(cache_path)
+
+    def _drop_entry(self, cache_path: str, reason: str) -> None:
+        """
+        Remove an unusable cache entry.
+        """
+        print(f"Dropping cache entry {cache_path}: {reason}")
+        for path in self._entry_files(cache_path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Error removing cache file {path}: {e}")
+
+    def _write_entry(self, cache_path: str, data: Any, model_cls: Type[BaseModel], response_bodies: bool = False) -> None:
+        """
+        Atomically write a cache entry so concurrent readers never see a partial file.
+        With response_bodies, gzip (and brotli, if installed) compressed JSON bodies are written next to it.
+        """
+        payload = _dumps(data)
+        entry = self._encode_entry(payload, model_cls)
+        files = {}
+        if response_bodies:
+            digest = hashlib.md5(payload).digest()
+            files[self._response_body_path(cache_path, digest, "gzip")] = gzip.compress(payload, compresslevel=9, mtime=0)
+            if brotli is not None:
+                files[self._response_body_path(cache_path, digest, "br")] = brotli.compress(payload)
+            # Bodies of the version being replaced stay, for requests that have just read its ETag
+            keep = set(files)
+            previous = self._read_header(cache_path, model_cls)
+            if previous is not None:
+                keep.update(self._response_body_path(cache_path, previous[1], encoding) for encoding in RESPONSE_BODY_EXTENSIONS)
+        files[cache_path] = entry
+
+        # Bodies are written before the entry, so a valid entry never names bodies that don't exist yet
+        for path, content in files.items():
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+
+        if response_bodies:
+            for path in self._response_body_files(cache_path):
+                if path not in keep:
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        print(f"Error removing cache file {path}: {e}")
     
     def get(self, doc_id: str, model: str) -> Optional[VisualResponse]:
         """
         Retrieve a cached visualization if available.
+        Entries are trusted (we wrote them with the current schema), so they are rebuilt without validation.
         
         Args:
             doc_id: Document ID
@@ -72,23 +356,84 @@ class VisualizationCache:
         """
         cache_path = self._get_cache_path(doc_id, model)
         
-        if not os.path.exists(cache_path):
+        try:
+            entry = self._read_entry(cache_path, VisualResponse)
+            if entry is None:
+                return None
+            
+            print(f"Cache hit for document {doc_id} with model {model}")
+            return construct_trusted_visual_response(_loads(entry[0]))
+        except Exception as e:
+            print(f"Error reading cache: {e}")
             return None
+
+    def get_bytes(self, doc_id: str, model: str, etag: Optional[str] = None) -> Optional[bytes]:
+        """
+        Retrieve the JSON encoding of a cached visualization, ready to be served as a response body.
         
-        try:
-            # Update file access time
-            os.utime(cache_path, None)
+        Args:
+            doc_id: Document ID
+            model: Model used for generating the visualization
+            etag: If given, only return the body if it still has this ETag (see get_etag)
             
-            with open(cache_path, 'r') as f:
-                cache_data = json.load(f)
+        Returns:
+            JSON bytes of the cached visualization or None if not found
+        """
+        cache_path = self._get_cache_path(doc_id, model)
+        
+        try:
+            entry = self._read_entry(cache_path, VisualResponse)
+            if entry is None:
+                return None
+            if etag is not None and etag != f'"{entry[1].hex()}"':
+                return None
             
             print(f"Cache hit for document {doc_id} with model {model}")
-            # Convert the cached JSON back to a VisualResponse
-            return VisualResponse.model_validate(cache_data)
+            return entry[0]
         except Exception as e:
             print(f"Error reading cache: {e}")
             return None
     
+    def get_etag(self, doc_id: str, model: str) -> Optional[str]:
+        """
+        Strong ETag of a cached visualization, read from the entry header without loading the payload.
+        
+        Args:
+            doc_id: Document ID
+            model: Model used for generating the visualization
+            
+        Returns:
+            Quoted hex digest of the cached JSON body, or None if not found
+        """
+        try:
+            header = self._read_header(self._get_cache_path(doc_id, model), VisualResponse)
+        except Exception as e:
+            print(f"Error reading cache: {e}")
+            return None
+        if header is None:
+            return None
+        return f'"{header[1].hex()}"'
+
+    def get_response_body_path(self, doc_id: str, model: str, encoding: str, etag: str) -> Optional[str]:
+        """
+        Path of a precompressed JSON body of a cached visualization.
+        The path is derived from the ETag, so the body matches it even if the entry was replaced since.
+        
+        Args:
+            doc_id: Document ID
+            model: Model used for generating the visualization
+            encoding: Content-Encoding, "br" or "gzip"
+            etag: ETag of the visualization, as returned by get_etag
+            
+        Returns:
+            Path to the compressed body or None if it isn't stored
+        """
+        if encoding not in RESPONSE_BODY_EXTENSIONS:
+            return None
+        digest = bytes.fromhex(etag.strip('"'))
+        path = self._response_body_path(self._get_cache_path(doc_id, model), digest, encoding)
+        return path if os.path.exists(path) else None
+
     def set(self, doc_id: str, model: str, visualization: VisualResponse) -> None:
         """
         Cache visualization data.
@@ -104,46 +449,95 @@ class VisualizationCache:
         cache_path = self._get_cache_path(doc_id, model)
         
         try:
-            # Convert VisualResponse to a dictionary of JSON serializable types and save as JSON
-            with open(cache_path, 'w') as f:
-                json.dump(visualization.model_dump(mode="json"), f)
+            self._write_entry(cache_path, visualization.model_dump(mode="json"), VisualResponse, response_bodies=True)
             print(f"Cached visualization for document {doc_id} with model {model}")
         except Exception as e:
             print(f"Error writing to cache: {e}")
     
-    def _get_cache_size_mb(self) -> float:
+    def get_module(self, module_key: str, model: str) -> Optional[VisualModule]:
         """
-        Calculate the current size of the cache in MB.
+        Retrieve a cached visualization module.
         
+        Args:
+            module_key: Content hash of the module's insight (see visualize.module_cache_key)
+            model: Model used for generating the module
+            
         Returns:
-            Cache size in MB
+            Cached module or None if not found
         """
-        total_size = 0
-        for path in glob.glob(os.path.join(self.cache_dir, "*.json")):
-            total_size += os.path.getsize(path)
+        try:
+            entry = self._read_entry(self._get_entry_path("module", module_key, model), VisualModule)
+            if entry is None:
+                return None
+            return _construct_module(_loads(entry[0]))
+        except Exception as e:
+            print(f"Error reading module cache: {e}")
+            return None
+
+    def set_module(self, module_key: str, model: str, module: VisualModule) -> None:
+        """
+        Cache a single visualization module.
         
-        return total_size / (1024 * 1024)  # Convert to MB
-    
-    def _get_cache_files_by_access_time(self) -> List[Tuple[str, float]]:
+        Args:
+            module_key: Content hash of the module's insight (see visualize.module_cache_key)
+            model: Model used for generating the module
+            module: The module to cache
         """
-        Get a list of cache files sorted by last access time.
+        try:
+            self._write_entry(self._get_entry_path("module", module_key, model), module.model_dump(mode="json"), VisualModule)
+        except Exception as e:
+            print(f"Error writing module to cache: {e}")
+
+    def get_insights(self, doc_id: str, model: str) -> Optional[InsightsReponse]:
+        """
+        Retrieve the cached section insights a visualization was generated from.
         
+        Args:
+            doc_id: Document ID
+            model: Model used for generating the insights
+            
         Returns:
-            List of tuples containing file path and access time
+            Cached insights or None if not found
         """
-        files = []
-        for path in glob.glob(os.path.join(self.cache_dir, "*.json")):
-            access_time = os.path.getatime(path)
-            files.append((path, access_time))
+        try:
+            entry = self._read_entry(self._get_entry_path("insights", doc_id, model), InsightsReponse)
+            if entry is None:
+                return None
+            return InsightsReponse.model_validate_json(entry[0])
+        except Exception as e:
+            print(f"Error reading insights cache: {e}")
+            return None
+
+    def set_insights(self, doc_id: str, model: str, insights: InsightsReponse) -> None:
+        """
+        Cache section insights so modules can be regenerated without re-analyzing the document.
+        
+        Args:
+            doc_id: Document ID
+            model: Model used for generating the insights
+            insights: The insights to cache
+        """
+        try:
+            self._write_entry(self._get_entry_path("insights", doc_id, model), insights.model_dump(mode="json"), InsightsReponse)
+        except Exception as e:
+            print(f"Error writing insights to cache: {e}")
+    
+    def _get_cache_size_mb(self) -> float:
+        """
+        Calculate the current size of the cache in MB.
         
-        # Sort by access time (oldest first)
-        return sorted(files, key=lambda x: x[1])
+        Returns:
+            Cache size in MB
+        """
+        total_size = sum(size for files in self._scan_entries().values() for _, size, _ in files)
+        return total_size / (1024 * 1024)  # Convert to MB
     
     def _cleanup_cache_if_needed(self) -> None:
         """
         Remove oldest cache files if cache exceeds maximum size.
         """
-        current_size_mb = self._get_cache_size_mb()
+        entries = self._scan_entries()
+        current_size_mb = sum(size for files in entries.values() for _, size, _ in files) / (1024 * 1024)
         
         # Only cleanup if we're exceeding the maximum size
         if current_size_mb <= self.max_cache_size_mb:
@@ -151,21 +545,22 @@ class VisualizationCache:
         
         print(f"Cache size ({current_size_mb:.2f}MB) exceeds maximum ({self.max_cache_size_mb}MB). Cleaning up...")
         
-        # Get files sorted by access time (oldest first)
-        files = self._get_cache_files_by_access_time()
+        def access_time(cache_path: str) -> float:
+            # Entries are ordered by when the entry file was last read; groups without one go first
+            return next((atime for path, _, atime in entries[cache_path] if path == cache_path), 0.0)
         
-        # Remove oldest files until we're under the limit
-        for file_path, _ in files:
+        # Remove oldest entries, together with their precompressed response bodies, until we're under the limit
+        for cache_path in sorted(entries, key=access_time):
             if current_size_mb <= self.max_cache_size_mb * 0.8:  # Target 80% of max size
                 break
                 
-            file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
-            try:
-                os.remove(file_path)
-                current_size_mb -= file_size_mb
-                print(f"Removed cache file: {file_path}")
-            except Exception as e:
-                print(f"Error removing cache file {file_path}: {e}")
+            for path, size, _ in entries[cache_path]:
+                try:
+                    os.remove(path)
+                    current_size_mb -= size / (1024 * 1024)
+                    print(f"Removed cache file: {path}")
+                except Exception as e:
+                    print(f"Error removing cache file {path}: {e}")
         
         print(f"Cache cleanup complete. New size: {current_size_mb:.2f}MB")
     
@@ -176,16 +571,18 @@ class VisualizationCache:
         """
         try:
             files_removed = 0
-            cache_size_before = self._get_cache_size_mb()
+            size_removed = 0
             
-            for file_path in glob.glob(os.path.join(self.cache_dir, "*.json")):
-                try:
-                    os.remove(file_path)
-                    files_removed += 1
-                except Exception as e:
-                    print(f"Error removing cache file {file_path}: {e}")
+            for files in self._scan_entries().values():
+                for file_path, size, _ in files:
+                    try:
+                        os.remove(file_path)
+                        files_removed += 1
+                        size_removed += size
+                    except Exception as e:
+                        print(f"Error removing cache file {file_path}: {e}")
             
-            print(f"Visualization cache cleared: removed {files_removed} files ({cache_size_before:.2f}MB)")
+            print(f"Visualization cache cleared: removed {files_removed} files ({size_removed / (1024 * 1024):.2f}MB)")
         except Exception as e:
             print(f"Error clearing visualization cache: {e}")
 
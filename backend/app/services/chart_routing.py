@@ -0,0 +1,122 @@
+import os
+import re
+import math
+import threading
+from typing import List, Dict
+
+# "single" sends every chart spec request to the main model.
+# "tiered" tries CHART_FAST_MODEL first and escalates to the main model only if its output fails check_chart_spec.
+CHART_ROUTING = os.getenv("CHART_ROUTING", "single").lower()
+CHART_FAST_MODEL = os.getenv("CHART_FAST_MODEL", "gpt-4o-mini")
+
+# Fraction of a chart's data values that must be found in the excerpts
+MIN_SUPPORTED_FRACTION = 0.8
+# Relative tolerance when matching a value to a number in the excerpts (allows for rounding)
+VALUE_TOLERANCE = 0.01
+# Unit conversions a model may apply, e.g. "$1,234 million" charted as 1.234 (billions) or 12% charted as 0.12
+_VALUE_SCALES = (1.0, 1e-3, 1e-6, 1e-9, 1e3, 1e6, 1e9, 1e-2, 1e2)
+
+_NUMBER_PATTERN = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?")
+
+
+def _excerpt_numbers(excerpts: List[str]) -> List[float]:
+    numbers = set()
+    for excerpt in excerpts:
+        for match in _NUMBER_PATTERN.findall(excerpt):
+            numbers.add(float(match.replace(",", "")))
+    return list(numbers)
+
+
+def _is_supported(value: float, numbers: List[float]) -> bool:
+    # Negative values usually appear as "(1,234)" or "decreased 5%" in filings
+    value = abs(value)
+    if value == 0:
+        return True
+    return any(
+        math.isclose(value, number * scale, rel_tol=VALUE_TOLERANCE)
+        for number in numbers
+        for scale in _VALUE_SCALES
+    )
+
+
+def check_chart_spec(chart, excerpts: List[str]) -> List[str]:
+    """
+    Deterministic checks of a chart spec against the excerpts it was generated from.
+    :param chart: A ChartSpec, or None if the model returned nothing.
+    :param excerpts: The retrieved excerpt texts given to the model.
+    :return: A list of problems. Empty if the chart passes.
+    """
+    if chart is None:
+        return ["no chart spec returned"]
+
+    problems = []
+    chart_type = chart.chart_type
+    values: List[float] = []
+
+    if chart_type == "text_card":
+        return ["fell back to a text card"]
+    elif chart_type in ("bar_chart", "line_chart"):
+        if len(chart.x_labels) != len(chart.y_values):
+            problems.append(f"{len(chart.x_labels)} x_labels but {len(chart.y_values)} y_values")
+        values = list(chart.y_values)
+    elif chart_type == "pie_chart":
+        if len(chart.labels) != len(chart.values):
+            problems.append(f"{len(chart.labels)} labels but {len(chart.values)} values")
+        values = list(chart.values)
+    elif chart_type == "multi_series_bar":
+        for series in chart.series:
+            if len(series.values) != len(chart.x_labels):
+                problems.append(f"series {series.name!r} has {len(series.values)} values for {len(chart.x_labels)} x_labels")
+            values.extend(series.values)
+    elif chart_type == "gauge_chart":
+        if not chart.min_value <= chart.current_value <= chart.max_value:
+            problems.append("current_value outside [min_value, max_value]")
+        values = [chart.current_value]
+    elif chart_type == "single_stat":
+        values = [chart.value]
+
+    if not values:
+        problems.append("no data values")
+        return problems
+
+    numbers = _excerpt_numbers(excerpts)
+    supported = sum(1 for value in values if _is_supported(value, numbers))
+    if supported < MIN_SUPPORTED_FRACTION * len(values):
+        problems.append(f"only {supported}/{len(values)} values appear in the excerpts")
+    return problems
+
+
+class ChartRoutingStats:
+    """
+    Thread-safe counters of chart spec calls per model tier: calls, latency and escalations.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, int] = {}
+        self._latency: Dict[str, float] = {}
+        self._escalations = 0
+
+    def record(self, tier: str, latency: float, escalated: bool = False) -> None:
+        with self._lock:
+            self._calls[tier] = self._calls.get(tier, 0) + 1
+            self._latency[tier] = self._latency.get(tier, 0.0) + latency
+            if escalated:
+                self._escalations += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            fast_calls = self._calls.get("fast", 0)
+            return {
+                "routing": CHART_ROUTING,
+                "tiers": {
+                    tier: {"calls": calls, "mean_latency_s": self._latency[tier] / calls}
+                    for tier, calls in self._calls.items()
+                },
+                "escalations": self._escalations,
+                "escalation_rate": self._escalations / fast_calls if fast_calls else None,
+            }
+
+
+# Create a singleton instance
+chart_routing_stats = ChartRoutingStats()
@@ -14,20 +14,37 @@ def get_openai_client():
 
 ### Pinecone
 
-VECTOR_DIMENSION = 1536 # hardcoded to text-embedding-3-small OAI model size for now
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# text-embedding-3 models can return shortened embeddings via the `dimensions` parameter.
+# 1536 is the native size of text-embedding-3-small; e.g. 512 cuts vector size 3x.
+VECTOR_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "1536"))
 
 INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "doc-visualizer-index")
 
+# Whether the server empties the index on startup and shutdown (and clears the visualization cache on shutdown).
+# Set to false to keep stored documents across restarts; the bulk ingestion CLI always forces it to false.
+RESET_ON_RESTART = os.getenv("DOC_VISUALIZER_RESET_ON_RESTART", "true").lower() == "true"
+
 pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
 
 def init_pinecone():
     """Initialize Pinecone (call once at startup).
     
-    If an index already exists, it will be emptied.
+    If an index already exists, it will be emptied (unless DOC_VISUALIZER_RESET_ON_RESTART is false).
     If an index doesn't exist, it will be created.
     """
     # Check if index exists
     if INDEX_NAME in pc.list_indexes().names():
+        # The dimension of an index can't be changed, so a mismatch needs a new index name
+        index_dimension = pc.describe_index(INDEX_NAME).dimension
+        if index_dimension != VECTOR_DIMENSION:
+            raise ValueError(
+                f"Index {INDEX_NAME} has dimension {index_dimension} but EMBEDDING_DIMENSION is {VECTOR_DIMENSION}. "
+                "Use a different PINECONE_INDEX_NAME or delete the index."
+            )
+        if not RESET_ON_RESTART:
+            print(f"Using existing index: {INDEX_NAME}")
+            return
         # Index exists, empty it
         host = pc.describe_index(INDEX_NAME).host
         index = pc.Index(INDEX_NAME, host)
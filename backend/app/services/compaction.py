@@ -0,0 +1,209 @@
+import re
+from collections import Counter
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+from pydantic import BaseModel
+
+from .parsing import num_tokens_from_string, iter_text_from_pdf
+from .minhash import MinHasher
+
+# Running headers / footers are looked for among the first and last lines of each page
+HEADER_FOOTER_LINES = 2
+# A line on at least this fraction of pages (and at least MIN_REPEATED_PAGES pages) is a running header / footer
+REPEATED_LINE_PAGE_FRACTION = 0.5
+MIN_REPEATED_PAGES = 3
+# Longer lines are content even if repeated (e.g. a recurring table row)
+MAX_BOILERPLATE_LINE_LENGTH = 120
+# Pages with fewer words than this after removing boilerplate are dropped
+MIN_PAGE_WORDS = 15
+
+_PAGE_NUMBER_LINE = re.compile(r"^\s*(page\s*)?(\d{1,4}|[ivxlc]{1,6})(\s*(of|/)\s*\d{1,4})?\s*$", re.IGNORECASE)
+# A line ending in a page number: "Item 1A. Risk Factors 15" / "Management's Discussion and Analysis ..... 42"
+_TOC_LINE = re.compile(r"^(item\s+\d+[a-z]?\.?\s+)?[^\d]*[a-z][^\d]*[\s.]\d{1,3}$", re.IGNORECASE)
+# What sets a table of contents apart from prose or a table ending in numbers: "Item N." / "Part II" entries
+# and dot leaders
+_TOC_STRUCTURE = re.compile(r"^(item\s+\d+[a-z]?\.|part\s+[ivx]+\b)|(\.{3,}|\u2026)\s*\d{1,3}$", re.IGNORECASE)
+# "10.1* Amended and Restated Credit Agreement ..." / "31.2 Certification of ..."
+_EXHIBIT_LINE = re.compile(r"^\d{1,3}(\.\d+)*\*{0,2}\s+\S")
+_DIGITS = re.compile(r"\d+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class CompactionReport(BaseModel):
+    pages_before: int
+    pages_after: int
+    lines_removed: int
+    tokens_before: int
+    tokens_after: int
+
+    def summary(self) -> str:
+        saved = self.tokens_before - self.tokens_after
+        percent = 100 * saved / self.tokens_before if self.tokens_before else 0.0
+        return (
+            f"{self.tokens_before} -> {self.tokens_after} tokens ({percent:.1f}% saved), "
+            f"{self.pages_before} -> {self.pages_after} pages ({self.pages_before - self.pages_after} low-information "
+            f"pages dropped), {self.lines_removed} boilerplate lines removed"
+        )
+
+
+def _line_key(line: str) -> str:
+    # Page numbers inside headers / footers differ per page, so digits are ignored when matching lines
+    return _WHITESPACE.sub(" ", _DIGITS.sub("#", line.strip().lower()))
+
+
+def _is_table_of_contents(lines: List[str]) -> bool:
+    # A "Table of Contents" heading alone proves nothing, since many filings repeat it as a link on every page
+    toc_lines = sum(1 for line in lines if _TOC_LINE.match(line))
+    structured_lines = sum(1 for line in lines if _TOC_STRUCTURE.search(line))
+    return toc_lines >= 4 and toc_lines >= 0.5 * len(lines) and structured_lines >= 3
+
+
+def _is_exhibit_index(lines: List[str]) -> bool:
+    if not any("exhibit" in line.lower() for line in lines):
+        return False
+    exhibit_lines = sum(1 for line in lines if _EXHIBIT_LINE.match(line))
+    return exhibit_lines >= 5 and exhibit_lines >= 0.4 * len(lines)
+
+
+def _edge_lines(lines: List[str]) -> List[Tuple[int, str]]:
+    """
+    The (index, line) pairs at the top and bottom of a page, where running headers and footers live.
+    """
+    edge_indices = sorted(set(range(min(HEADER_FOOTER_LINES, len(lines)))) |
+                          set(range(max(0, len(lines) - HEADER_FOOTER_LINES), len(lines))))
+    return [(i, lines[i]) for i in edge_indices]
+
+
+def find_boilerplate_lines(pages: Iterable[str]) -> set:
+    """
+    Find the keys of short lines that repeat at the top or bottom of many pages, e.g. running headers and footers.
+    Pages are consumed one at a time and only their edge lines are kept, so pages can be streamed from a PDF.
+    """
+    page_counts = Counter()
+    num_pages = 0
+    for page in pages:
+        lines = [line for line in page.splitlines() if line.strip()]
+        page_counts.update({_line_key(line) for _, line in _edge_lines(lines)})
+        num_pages += 1
+
+    min_pages = max(MIN_REPEATED_PAGES, REPEATED_LINE_PAGE_FRACTION * num_pages)
+    return {
+        key for key, count in page_counts.items()
+        if count >= min_pages and len(key) <= MAX_BOILERPLATE_LINE_LENGTH
+    }
+
+
+def compact_page(page: str, boilerplate: set) -> Tuple[str, int]:
+    """
+    Remove boilerplate lines from a page. Returns the compacted page (empty if it is low-information) and the
+    number of boilerplate lines removed. Other lines of a dropped page are not counted.
+    """
+    lines = [line for line in page.splitlines() if line.strip()]
+    removed_indices = {
+        i for i, line in _edge_lines(lines)
+        if _line_key(line) in boilerplate or _PAGE_NUMBER_LINE.match(line)
+    }
+    kept = [line for i, line in enumerate(lines) if i not in removed_indices]
+
+    # Classify the page by what is left, so running headers don't make it look like a table of contents
+    removed = len(lines) - len(kept)
+    if _is_table_of_contents(kept) or _is_exhibit_index(kept):
+        return "", removed
+    if len(" ".join(kept).split()) < MIN_PAGE_WORDS:
+        return "", removed
+    return "\n".join(kept), removed
+
+
+class PageCompactor:
+    """
+    Compacts pages one at a time against a known set of boilerplate lines, keeping a running token budget report.
+    """
+
+    def __init__(self, boilerplate: set):
+        self.boilerplate = boilerplate
+        self.pages_before = 0
+        self.pages_after = 0
+        self.lines_removed = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def compact(self, page: str) -> str:
+        """
+        Compact a page. Returns an empty string if it is low-information and should be dropped.
+        """
+        text, removed = compact_page(page, self.boilerplate)
+        self.pages_before += 1
+        self.lines_removed += removed
+        self.tokens_before += num_tokens_from_string(page)
+        if text:
+            self.pages_after += 1
+            self.tokens_after += num_tokens_from_string(text)
+        return text
+
+    def keep_uncompacted(self, page: str) -> str:
+        """
+        Count a page that is kept as is, for when a document would otherwise be compacted away entirely.
+        """
+        self.pages_after += 1
+        self.tokens_after += num_tokens_from_string(page)
+        return page
+
+    def report(self) -> CompactionReport:
+        return CompactionReport(
+            pages_before=self.pages_before,
+            pages_after=self.pages_after,
+            lines_removed=self.lines_removed,
+            tokens_before=self.tokens_before,
+            tokens_after=self.tokens_after
+        )
+
+
+class DocumentScan(BaseModel):
+    boilerplate: Set[str]
+    signature: List[int]
+
+
+def scan_pdf(file_path: str) -> DocumentScan:
+    """
+    First streaming pass over a PDF: find its running headers / footers and compute its near-duplicate
+    signature, holding one page in memory at a time.
+    """
+    hasher = MinHasher()
+
+    def hashed_pages() -> Iterator[str]:
+        for page in iter_text_from_pdf(file_path):
+            hasher.update(page)
+            yield page
+
+    boilerplate = find_boilerplate_lines(hashed_pages())
+    return DocumentScan(boilerplate=boilerplate, signature=hasher.signature())
+
+
+def iter_compacted_pages(file_path: str, boilerplate: set) -> Iterator[str]:
+    """
+    Second streaming pass over a PDF: yield its compacted pages one at a time, so callers can embed and store
+    them page by page. The boilerplate lines come from a first pass, see scan_pdf.
+    """
+    compactor = PageCompactor(boilerplate)
+    compacted_any = False
+    for page in iter_text_from_pdf(file_path):
+        text = compactor.compact(page)
+        if text:
+            compacted_any = True
+            yield text
+
+    # Never compact a document away entirely
+    if not compacted_any:
+        for page in iter_text_from_pdf(file_path):
+            yield compactor.keep_uncompacted(page)
+    print(f"Compacted {file_path}: {compactor.report().summary()}")
+
+
+def compacted_chunks_from_pdf(file_path: str, boilerplate: Optional[set] = None) -> List[str]:
+    """
+    Parse a PDF into page chunks and compact them. This is the text view used for embeddings and LLM prompts.
+    The PDF is streamed twice (once to find boilerplate lines, unless given, and once to compact), so only
+    the compacted text is held in memory, not the parsed pages.
+    """
+    if boilerplate is None:
+        boilerplate = find_boilerplate_lines(iter_text_from_pdf(file_path))
+    return list(iter_compacted_pages(file_path, boilerplate))
@@ -0,0 +1,166 @@
+import os
+import json
+import threading
+from typing import List, Dict, Optional, Tuple
+
+# Signatures are computed in minhash, which parse workers import without loading this index
+from .minhash import NUM_BANDS, ROWS_PER_BAND, page_fingerprint, estimate_similarity
+
+TEMP_DIRECTORY = os.getenv("TEMP_DIRECTORY", "/tmp")
+DEDUP_INDEX_PATH = os.getenv("DOC_VISUALIZER_DEDUP_INDEX", os.path.join(TEMP_DIRECTORY, "doc_visualizer_dedup.jsonl"))
+# Minimum estimated Jaccard similarity of word shingles for two documents to count as near-duplicates
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+
+
+class NearDuplicateIndex:
+    """
+    LSH index over MinHash signatures of ingested documents, plus their page fingerprints.
+    Persisted as an append-only JSONL file so it survives restarts and is shared with the bulk ingestion CLI:
+    lines appended by another process are read before every lookup.
+    """
+
+    def __init__(self, index_path: str = DEDUP_INDEX_PATH, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        """
+        Initialize the index.
+
+        Args:
+            index_path: JSONL file the index is persisted to. Defaults to environment variable DOC_VISUALIZER_DEDUP_INDEX.
+            threshold: Minimum estimated similarity to report a near-duplicate. Defaults to environment variable NEAR_DUPLICATE_THRESHOLD or 0.8.
+        """
+        self.index_path = index_path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._signatures: Dict[str, List[int]] = {}
+        self._fingerprints: Dict[str, List[str]] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[str]] = {}
+        # Identity of the file and how far it has been read
+        self._file_id: Optional[Tuple[int, int]] = None
+        self._offset = 0
+
+        with self._lock:
+            self._refresh()
+
+    def _reset(self) -> None:
+        self._signatures.clear()
+        self._fingerprints.clear()
+        self._buckets.clear()
+        self._file_id = None
+        self._offset = 0
+
+    def _refresh(self) -> None:
+        """
+        Read records appended to the index file since the last read, e.g. by the ingestion CLI.
+        If the file was removed or replaced (the index was cleared), start over. Must hold the lock.
+        """
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            if self._file_id is not None:
+                self._reset()
+            return
+
+        file_id = (stat.st_dev, stat.st_ino)
+        if file_id != self._file_id or stat.st_size < self._offset:
+            self._reset()
+            self._file_id = file_id
+        if stat.st_size == self._offset:
+            return
+
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # A line without its newline is still being written, so it is read next time
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                self._insert(record["doc_id"], record["signature"], record["page_fingerprints"])
+        self._offset += len(complete)
+
+    def _bands(self, signature: List[int]):
+        for band in range(NUM_BANDS):
+            yield band, tuple(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])
+
+    def _insert(self, doc_id: str, signature: List[int], fingerprints: List[str]) -> None:
+        if doc_id not in self._signatures:
+            for band_key in self._bands(signature):
+                self._buckets.setdefault(band_key, []).append(doc_id)
+        self._signatures[doc_id] = signature
+        self._fingerprints[doc_id] = fingerprints
+
+    def clear(self) -> None:
+        """
+        Remove every document from the index, e.g. after the vector index they were stored in was emptied.
+        """
+        with self._lock:
+            self._reset()
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+
+    def add(self, doc_id: str, chunks: List[str], signature: List[int]) -> None:
+        """
+        Add an ingested document to the index.
+
+        Args:
+            doc_id: Document ID
+            chunks: The document's text chunks, in the order they were stored
+            signature: The document's MinHash signature, see MinHasher
+        """
+        fingerprints = [page_fingerprint(chunk) for chunk in chunks]
+        with self._lock:
+            self._refresh()
+            self._insert(doc_id, signature, fingerprints)
+            with open(self.index_path, 'a') as f:
+                f.write(json.dumps({"doc_id": doc_id, "signature": signature, "page_fingerprints": fingerprints}) + "\n")
+
+    def find(self, signature: List[int], exclude_doc_id: Optional[str] = None) -> Optional[Tuple[str, float]]:
+        """
+        Find the most similar indexed document, if it is a near-duplicate.
+
+        Args:
+            signature: MinHash signature of the new document
+            exclude_doc_id: Document ID to ignore, e.g. the new document itself
+
+        Returns:
+            Tuple of the matching document ID and estimated similarity, or None if there is no near-duplicate
+        """
+        with self._lock:
+            self._refresh()
+            candidates = {
+                doc_id
+                for band_key in self._bands(signature)
+                for doc_id in self._buckets.get(band_key, [])
+                if doc_id != exclude_doc_id
+            }
+            scored = [(doc_id, estimate_similarity(signature, self._signatures[doc_id])) for doc_id in candidates]
+
+        best = max(scored, key=lambda item: item[1], default=None)
+        if best is None or best[1] < self.threshold:
+            return None
+        return best
+
+    def matching_pages(self, doc_id: str, chunks: List[str]) -> Dict[int, int]:
+        """
+        Map chunk indices of a new document to identical chunks of an indexed document.
+
+        Args:
+            doc_id: Indexed document to compare against
+            chunks: Text chunks of the new document
+
+        Returns:
+            Dict of new chunk index to the chunk index in doc_id with the same fingerprint
+        """
+        with self._lock:
+            self._refresh()
+            existing = {fingerprint: i for i, fingerprint in enumerate(self._fingerprints.get(doc_id, []))}
+        matches = {}
+        for i, chunk in enumerate(chunks):
+            j = existing.get(page_fingerprint(chunk))
+            if j is not None:
+                matches[i] = j
+        return matches
+
+
+# Create a singleton instance
+near_duplicate_index = NearDuplicateIndex()
@@ -1,13 +1,21 @@
 from tenacity import retry, wait_random_exponential, stop_after_attempt
-from typing import List
+from typing import List, Optional
 
-from .clients import get_openai_client
+from .clients import get_openai_client, EMBEDDING_MODEL, VECTOR_DIMENSION
 
 # Retry up to 6 times with exponential backoff, starting at 1 second and maxing out at 20 seconds delay
 @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
-def get_embedding(text: List[str], model="text-embedding-3-small") -> List[List[float]]:
+def get_embedding(
+    text: List[str],
+    model: str = EMBEDDING_MODEL,
+    dimensions: Optional[int] = VECTOR_DIMENSION
+) -> List[List[float]]:
     """
     Takes a list of text chunks and returns a list of embeddings.
+    `dimensions` shortens the embeddings and is only supported by text-embedding-3 models.
     """
     client = get_openai_client()
-    return [chunk.embedding for chunk in client.embeddings.create(input=text, model=model).data]
+    kwargs = {}
+    if dimensions and model.startswith("text-embedding-3"):
+        kwargs["dimensions"] = dimensions
+    return [chunk.embedding for chunk in client.embeddings.create(input=text, model=model, **kwargs).data]
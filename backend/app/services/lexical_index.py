@@ -0,0 +1,129 @@
+import os
+import re
+import json
+import math
+from collections import Counter
+from functools import lru_cache
+from typing import List, Dict, Optional
+
+TEMP_DIRECTORY = os.getenv("TEMP_DIRECTORY", "/tmp")
+LEXICAL_INDEX_DIR = os.getenv("DOC_VISUALIZER_LEXICAL_INDEX_DIR", os.path.join(TEMP_DIRECTORY, "doc_visualizer_lexical"))
+
+# Standard BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_INDEX_VERSION = 1
+
+# Numbers like "1,234.5" and words like "company's" are kept as single tokens
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.,'][a-z0-9]+)*")
+
+_STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the their this to was were will with
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase and split text into terms, dropping stopwords.
+    """
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+def _index_path(doc_id: str) -> str:
+    return os.path.join(LEXICAL_INDEX_DIR, f"{doc_id}.json")
+
+
+def build_lexical_index(doc_id: str, chunks: List[str]) -> None:
+    """
+    Build and persist an inverted index over a document's chunks for BM25 retrieval.
+    :param doc_id: Unique ID for the document.
+    :param chunks: The text chunks from parsing the PDF, in the same order they were upserted.
+    """
+    postings: Dict[str, List[List[int]]] = {}
+    doc_lengths = []
+    for i, chunk in enumerate(chunks):
+        terms = tokenize(chunk)
+        doc_lengths.append(len(terms))
+        for term, tf in Counter(terms).items():
+            postings.setdefault(term, []).append([i, tf])
+
+    os.makedirs(LEXICAL_INDEX_DIR, exist_ok=True)
+    index_path = _index_path(doc_id)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            "version": _INDEX_VERSION,
+            "chunks": chunks,
+            "doc_lengths": doc_lengths,
+            "postings": postings
+        }, f)
+    os.replace(tmp_path, index_path)
+    _load_lexical_index.cache_clear()
+
+
+@lru_cache(maxsize=32)
+def _load_lexical_index(doc_id: str) -> Optional[Dict]:
+    index_path = _index_path(doc_id)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, 'r') as f:
+        index = json.load(f)
+    if index.get("version") != _INDEX_VERSION:
+        return None
+    return index
+
+
+def has_lexical_index(doc_id: str) -> bool:
+    """
+    Whether a lexical index has been built for the document.
+    """
+    return _load_lexical_index(doc_id) is not None
+
+
+def get_chunk_texts(doc_id: str) -> Optional[List[str]]:
+    """
+    The document's chunk texts, indexed by chunk_index, or None if it has no lexical index.
+    """
+    index = _load_lexical_index(doc_id)
+    return index["chunks"] if index is not None else None
+
+
+def query_lexical(query_text: str, doc_id: str, top_k: int = 5) -> List[Dict]:
+    """
+    Rank a document's chunks against a query with BM25, without any network calls.
+    :param query_text: The query, e.g. an insight name and summary.
+    :param doc_id: The document ID to search.
+    :param top_k: How many matches to retrieve.
+    :return: A list of matches in the same shape as Pinecone matches: { id, score, metadata }.
+    """
+    index = _load_lexical_index(doc_id)
+    if index is None:
+        return []
+
+    doc_lengths = index["doc_lengths"]
+    num_chunks = len(doc_lengths)
+    if num_chunks == 0:
+        return []
+    avg_length = sum(doc_lengths) / num_chunks or 1.0
+
+    scores: Dict[int, float] = {}
+    for term in set(tokenize(query_text)):
+        term_postings = index["postings"].get(term)
+        if not term_postings:
+            continue
+        df = len(term_postings)
+        idf = math.log(1 + (num_chunks - df + 0.5) / (df + 0.5))
+        for i, tf in term_postings:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[i] / avg_length)
+            scores[i] = scores.get(i, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [
+        {
+            "id": f"{doc_id}-{i}",
+            "score": score,
+            "metadata": {"doc_id": doc_id, "text": index["chunks"][i], "chunk_index": i}
+        }
+        for i, score in ranked
+    ]
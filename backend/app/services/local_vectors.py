@@ -0,0 +1,225 @@
+import os
+import json
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from .lexical_index import get_chunk_texts
+
+TEMP_DIRECTORY = os.getenv("TEMP_DIRECTORY", "/tmp")
+LOCAL_VECTOR_DIR = os.getenv("DOC_VISUALIZER_LOCAL_VECTOR_DIR", os.path.join(TEMP_DIRECTORY, "doc_visualizer_vectors"))
+# "int8" keeps int8 codes in memory and rescores candidates with float vectors read from disk, "none" keeps float32
+LOCAL_VECTOR_QUANTIZATION = os.getenv("LOCAL_VECTOR_QUANTIZATION", "int8").lower()
+# How many candidates per requested match are rescored with float vectors
+RESCORE_FACTOR = 4
+
+
+# A document is stored as raw row-major arrays that batches are appended to, plus a small JSON file with the
+# number of committed rows. Rows past that count (e.g. from an interrupted write) are overwritten.
+_FLOATS = ".f32"
+_CODES = ".i8"
+_SCALES = ".scales.f32"
+_META = ".vectors.json"
+
+
+def _vector_path(doc_id: str, extension: str) -> str:
+    return os.path.join(LOCAL_VECTOR_DIR, f"{doc_id}{extension}")
+
+
+def _read_meta(doc_id: str) -> Optional[Dict]:
+    path = _vector_path(doc_id, _META)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _write_meta(doc_id: str, meta: Dict) -> None:
+    path = _vector_path(doc_id, _META)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, path)
+
+
+def _write_rows(path: str, rows: np.ndarray, start_row: int) -> None:
+    """
+    Write rows at start_row of a raw array file, dropping anything after them.
+    """
+    with open(path, 'r+b' if start_row > 0 else 'wb') as f:
+        f.seek(start_row * rows.itemsize * int(np.prod(rows.shape[1:])))
+        f.truncate()
+        f.write(np.ascontiguousarray(rows).tobytes())
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-vector int8 scalar quantization.
+    :return: The int8 codes and the float32 scale of each vector, so that vectors ~= codes * scales.
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales = np.maximum(scales, 1e-12).astype(np.float32)
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales
+
+
+def _search(
+    query: np.ndarray,
+    floats: np.ndarray,
+    codes: Optional[np.ndarray],
+    scales: Optional[np.ndarray],
+    top_k: int,
+    rescore: bool = True
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cosine search over normalized vectors. With codes, a first pass over the int8 codes picks
+    candidates, which are optionally rescored with their float vectors.
+    :return: Indices and scores of the top-k matches, best first.
+    """
+    if codes is None:
+        scores = floats @ query
+        order = np.argsort(-scores)[:top_k]
+        return order, scores[order]
+
+    approx = (codes @ query) * scales
+    if not rescore:
+        order = np.argsort(-approx)[:top_k]
+        return order, approx[order]
+
+    num_candidates = min(len(approx), top_k * RESCORE_FACTOR)
+    candidates = np.argpartition(-approx, num_candidates - 1)[:num_candidates]
+    candidates.sort()  # Sequential reads from the memory-mapped float file
+    exact = np.asarray(floats[candidates]) @ query
+    order = np.argsort(-exact)[:top_k]
+    return candidates[order], exact[order]
+
+
+def measure_quantization_recall(
+    floats: np.ndarray,
+    codes: np.ndarray,
+    scales: np.ndarray,
+    top_k: int = 3,
+    max_queries: int = 100
+) -> Dict[str, float]:
+    """
+    Measure recall@k of int8 search against exact float search, using the document's own chunks as queries.
+    :param floats: Normalized float vectors, e.g. memory-mapped from disk.
+    :param codes: Their int8 codes.
+    :param scales: Their int8 scales.
+    """
+    top_k = min(top_k, len(floats))
+    queries = np.asarray(floats[np.linspace(0, len(floats) - 1, min(max_queries, len(floats))).astype(int)])
+
+    hits = {"int8": 0, "int8_rescored": 0}
+    for query in queries:
+        exact = set(_search(query, floats, None, None, top_k)[0].tolist())
+        hits["int8"] += len(exact & set(_search(query, floats, codes, scales, top_k, rescore=False)[0].tolist()))
+        hits["int8_rescored"] += len(exact & set(_search(query, floats, codes, scales, top_k)[0].tolist()))
+
+    total = len(queries) * top_k
+    return {name: count / total for name, count in hits.items()}
+
+
+def save_local_embeddings(doc_id: str, embeddings: List[List[float]], start_index: int = 0) -> None:
+    """
+    Store a batch of a document's embeddings locally instead of in Pinecone.
+    Only the new rows are normalized, quantized and appended, so storing a document in micro-batches costs
+    memory and I/O proportional to the batch. Call finish_local_embeddings once the last batch is stored.
+    :param doc_id: Unique ID for the document.
+    :param embeddings: The embeddings of the document's chunks.
+    :param start_index: Chunk index of the first embedding, for storing a document in several calls.
+    """
+    if not embeddings:
+        return
+    os.makedirs(LOCAL_VECTOR_DIR, exist_ok=True)
+    floats = _normalize(np.asarray(embeddings, dtype=np.float32))
+
+    if start_index > 0:
+        meta = _read_meta(doc_id)
+        stored = meta["count"] if meta else 0
+        if stored != start_index:
+            raise ValueError(f"Expected {start_index} stored vectors for {doc_id}, found {stored}")
+
+    _write_rows(_vector_path(doc_id, _FLOATS), floats, start_index)
+    if LOCAL_VECTOR_QUANTIZATION == "int8":
+        codes, scales = quantize_int8(floats)
+        _write_rows(_vector_path(doc_id, _CODES), codes, start_index)
+        _write_rows(_vector_path(doc_id, _SCALES), scales, start_index)
+
+    # Committed last, so readers never see rows that are only partly written
+    _write_meta(doc_id, {
+        "count": start_index + len(floats),
+        "dimension": floats.shape[1],
+        "quantization": LOCAL_VECTOR_QUANTIZATION
+    })
+    _load_local_vectors.cache_clear()
+
+
+def finish_local_embeddings(doc_id: str) -> None:
+    """
+    Report how much memory int8 quantization saves for a fully stored document, and its recall against
+    exact float search. Float vectors are read from the memory-mapped file rather than loaded.
+    """
+    stored = _load_local_vectors(doc_id)
+    if stored is None or stored[1] is None or len(stored[0]) < 2:
+        return
+    floats, codes, scales = stored
+    recall = measure_quantization_recall(floats, codes, scales)
+    print(f"Local int8 vectors for {doc_id}: {floats.nbytes / codes.nbytes:.1f}x smaller in memory, "
+          f"recall@3 {recall['int8']:.3f} ({recall['int8_rescored']:.3f} with float rescoring)")
+
+
+@lru_cache(maxsize=32)
+def _load_local_vectors(doc_id: str) -> Optional[Tuple[np.ndarray, Optional[np.ndarray], Optional[np.ndarray]]]:
+    meta = _read_meta(doc_id)
+    if meta is None or meta["count"] == 0:
+        return None
+    count, dimension = meta["count"], meta["dimension"]
+    floats = np.memmap(_vector_path(doc_id, _FLOATS), dtype=np.float32, mode="r", shape=(count, dimension))
+    if LOCAL_VECTOR_QUANTIZATION == "int8" and meta["quantization"] == "int8":
+        # Float vectors stay on disk and are only read for rescoring candidates
+        codes = np.fromfile(_vector_path(doc_id, _CODES), dtype=np.int8, count=count * dimension)
+        scales = np.fromfile(_vector_path(doc_id, _SCALES), dtype=np.float32, count=count)
+        return floats, codes.reshape(count, dimension), scales
+    return np.array(floats), None, None
+
+
+def fetch_local_embeddings(doc_id: str, chunk_indices: List[int]) -> Dict[int, List[float]]:
+    """
+    Read stored embeddings of specific chunks of a document.
+    """
+    stored = _load_local_vectors(doc_id)
+    if stored is None:
+        return {}
+    floats = stored[0]
+    return {i: np.asarray(floats[i]).tolist() for i in chunk_indices if i < len(floats)}
+
+
+def query_local(query_embedding: List[float], doc_id: str, top_k: int = 5) -> List[Dict]:
+    """
+    Query locally stored vectors for the top-k most similar chunks of a document.
+    :return: A list of matches in the same shape as Pinecone matches: { id, score, metadata }.
+    """
+    stored = _load_local_vectors(doc_id)
+    if stored is None:
+        return []
+    floats, codes, scales = stored
+
+    query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+    indices, scores = _search(query, floats, codes, scales, min(top_k, len(floats)))
+
+    texts = get_chunk_texts(doc_id) or []
+    return [
+        {
+            "id": f"{doc_id}-{i}",
+            "score": float(score),
+            "metadata": {"doc_id": doc_id, "text": texts[i] if i < len(texts) else "", "chunk_index": int(i)}
+        }
+        for i, score in zip(indices.tolist(), scores.tolist())
+    ]
@@ -0,0 +1,85 @@
+import re
+import hashlib
+from typing import List
+
+SHINGLE_SIZE = 5
+NUM_BANDS = 32
+ROWS_PER_BAND = 4
+SIGNATURE_SIZE = NUM_BANDS * ROWS_PER_BAND  # 128, must be a power of two
+
+_BIN_BITS = SIGNATURE_SIZE.bit_length() - 1
+_VALUE_MASK = (1 << (64 - _BIN_BITS)) - 1
+_EMPTY_BIN = _VALUE_MASK + 1
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def _normalize(text: str) -> List[str]:
+    return _WORD_PATTERN.findall(text.lower())
+
+
+def page_fingerprint(text: str) -> str:
+    """
+    Fingerprint of a page's text that ignores case, whitespace and punctuation differences.
+    """
+    return hashlib.sha1(" ".join(_normalize(text)).encode()).hexdigest()
+
+
+def _shingle_hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+
+
+class MinHasher:
+    """
+    Computes a document's MinHash signature from its text one chunk at a time, e.g. while pages are streamed
+    from a PDF. Shingles span chunk boundaries, so the result is the same as minhash_signature.
+    """
+
+    def __init__(self):
+        self._signature = [_EMPTY_BIN] * SIGNATURE_SIZE
+        self._tail: List[str] = []  # The last SHINGLE_SIZE - 1 words, which start shingles continued by the next chunk
+        self._hashed_any = False
+
+    def _add(self, shingle: str) -> None:
+        h = _shingle_hash(shingle)
+        bin_index = h >> (64 - _BIN_BITS)
+        value = h & _VALUE_MASK
+        if value < self._signature[bin_index]:
+            self._signature[bin_index] = value
+        self._hashed_any = True
+
+    def update(self, text: str) -> None:
+        words = self._tail + _normalize(text)
+        for i in range(len(words) - SHINGLE_SIZE + 1):
+            self._add(" ".join(words[i:i + SHINGLE_SIZE]))
+        self._tail = words[max(0, len(words) - SHINGLE_SIZE + 1):]
+
+    def signature(self) -> List[int]:
+        if not self._hashed_any:
+            # A document shorter than one shingle is hashed as a single shingle
+            self._add(" ".join(self._tail))
+        return list(self._signature)
+
+
+def minhash_signature(chunks: List[str]) -> List[int]:
+    """
+    MinHash signature of a document's word shingles, using one-permutation hashing:
+    each shingle is hashed once, the top bits pick a bin and each bin keeps its minimum value.
+    """
+    hasher = MinHasher()
+    for chunk in chunks:
+        hasher.update(chunk)
+    return hasher.signature()
+
+
+def estimate_similarity(signature_a: List[int], signature_b: List[int]) -> float:
+    """
+    Estimate the Jaccard similarity of two documents from their signatures.
+    """
+    compared = matches = 0
+    for a, b in zip(signature_a, signature_b):
+        if a == _EMPTY_BIN and b == _EMPTY_BIN:
+            continue
+        compared += 1
+        matches += a == b
+    return matches / compared if compared else 0.0
@@ -1,4 +1,8 @@
+from typing import Iterator, List
+
 import pdfplumber
+from pdfplumber.page import Page
+from pdfminer.pdfpage import PDFPage
 from tiktoken import get_encoding
 
 def num_tokens_from_string(string: str, encoding_name: str = "cl100k_base") -> int:
@@ -9,13 +13,25 @@ def num_tokens_from_string(string: str, encoding_name: str = "cl100k_base") -> i
 
 # TODO: This function should be more sophisticated. Instead of chunking by page, should be by section
 #       determined by extracted document formatting.
-def chunk_text_from_pdf(file_path: str) -> str:
-    text_chunks = []
+def iter_text_from_pdf(file_path: str) -> Iterator[str]:
+    """
+    Yield the text of each non-empty page of a PDF, one page at a time.
+    Unlike iterating `pdf.pages`, which keeps every page object alive, each page is created on demand and its
+    layout cache is released after extraction, so memory stays flat no matter how long the document is.
+    """
     with pdfplumber.open(file_path) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text()
+        doctop = 0
+        for i, pdfminer_page in enumerate(PDFPage.create_pages(pdf.doc)):
+            page = Page(pdf, pdfminer_page, page_number=i + 1, initial_doctop=doctop)
+            doctop += page.height
+            try:
+                text = page.extract_text()
+            finally:
+                page.close()
             if text:
                 # TODO: Check embedding size limits via tiktoken. OAI embeddings allow up to 8191 tokens.
                 #       Page / chunk could be more than 8191 tokens.
-                text_chunks.append(text)
-    return text_chunks
\ No newline at end of file
+                yield text
+
+def chunk_text_from_pdf(file_path: str) -> List[str]:
+    return list(iter_text_from_pdf(file_path))
@@ -1,48 +1,161 @@
-from typing import List, Dict
+import os
+from typing import List, Dict, Optional
 
 from .clients import get_pinecone_client
+from .embeddings import get_embedding
+from .lexical_index import query_lexical, has_lexical_index, get_chunk_texts
+
+# "pinecone" or "local". The local store keeps (optionally int8 quantized) vectors on this machine.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+if VECTOR_BACKEND == "local":
+    from .local_vectors import save_local_embeddings, finish_local_embeddings, query_local, fetch_local_embeddings
+
+# Whether to store chunk text in Pinecone metadata. If false, text is read from the local lexical index.
+PINECONE_STORE_TEXT = os.getenv("PINECONE_STORE_TEXT", "true").lower() == "true"
+
+# "dense" (Pinecone only), "lexical" (local BM25 only, no network calls) or "hybrid" (reciprocal rank fusion of both)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense").lower()
+
+# Reciprocal rank fusion constant, as in the original RRF paper
+RRF_K = 60
 
 def upsert_embeddings(
     doc_id: str, 
     chunks: List[str], 
-    embeddings: List[List[float]]
+    embeddings: List[List[float]],
+    start_index: int = 0,
+    batch_size: int = 100
 ) -> None:
     """
     Store multiple text chunks as vectors in Pinecone.
     :param doc_id: Unique ID for the document.
     :param chunks: The text chunks from parsing the PDF.
     :param embeddings: The corresponding embeddings for each text chunk.
+    :param start_index: Chunk index of the first chunk, for upserting a document in several calls.
+    :param batch_size: Maximum number of vectors sent per upsert request.
     """
     if len(chunks) != len(embeddings):
         raise ValueError("chunks and embeddings length mismatch")
 
+    if VECTOR_BACKEND == "local":
+        save_local_embeddings(doc_id, embeddings, start_index=start_index)
+        return
+
     vectors_to_upsert = []
-    for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+    for i, (chunk, embedding) in enumerate(zip(chunks, embeddings), start=start_index):
         vector_id = f"{doc_id}-{i}"
         metadata = {
             "doc_id": doc_id,
-            "text": chunk,
             "chunk_index": i
         }
+        if PINECONE_STORE_TEXT:
+            metadata["text"] = chunk
         vectors_to_upsert.append((vector_id, embedding, metadata))
 
     index = get_pinecone_client()
 
-    # Upsert into Pinecone
-    index.upsert(vectors=vectors_to_upsert)
+    # Upsert into Pinecone in batches to stay under the request size limit
+    for start in range(0, len(vectors_to_upsert), batch_size):
+        index.upsert(vectors=vectors_to_upsert[start:start + batch_size])
+
+def finish_embeddings(doc_id: str) -> None:
+    """
+    Call once every batch of a document has been upserted.
+    :param doc_id: Unique ID for the document.
+    """
+    if VECTOR_BACKEND == "local":
+        finish_local_embeddings(doc_id)
+
+def fetch_embeddings(doc_id: str, chunk_indices: List[int], batch_size: int = 100) -> Dict[int, List[float]]:
+    """
+    Fetch the stored embeddings of specific chunks of a document.
+    :param doc_id: Unique ID for the document.
+    :param chunk_indices: Indices of the chunks to fetch.
+    :param batch_size: Maximum number of vectors per fetch request.
+    :return: Dict of chunk index to embedding. Chunks that aren't stored are missing.
+    """
+    if VECTOR_BACKEND == "local":
+        return fetch_local_embeddings(doc_id, chunk_indices)
+
+    index = get_pinecone_client()
+    embeddings = {}
+    for start in range(0, len(chunk_indices), batch_size):
+        ids = {f"{doc_id}-{i}": i for i in chunk_indices[start:start + batch_size]}
+        response = index.fetch(ids=list(ids))
+        for vector_id, vector in response.vectors.items():
+            embeddings[ids[vector_id]] = list(vector.values)
+    return embeddings
+
+def has_stored_embeddings(doc_id: str) -> bool:
+    """
+    Whether a document still has vectors in the store, e.g. it wasn't removed by an index reset.
+    """
+    return bool(fetch_embeddings(doc_id, [0]))
+
+def needs_query_embedding(doc_id: str, mode: str = RETRIEVAL_MODE) -> bool:
+    """
+    Whether query_top_k needs a query embedding for this document and retrieval mode.
+    Lexical retrieval falls back to dense retrieval for documents without a lexical index.
+    """
+    return mode != "lexical" or not has_lexical_index(doc_id)
 
 def query_top_k(
-    query_embedding: List[float],
+    query_embedding: Optional[List[float]],
     doc_id: str,
     top_k: int = 5,
+    query_text: Optional[str] = None,
+    mode: str = RETRIEVAL_MODE,
 ) -> List[Dict]:
     """
-    Query Pinecone for the top-k most similar vectors that belong to a specific document.
-    :param query_embedding: The embedding of the user query or content to match.
+    Query for the top-k most relevant chunks that belong to a specific document.
+    :param query_embedding: The embedding of the user query or content to match. Not needed in lexical mode,
+        where it is only computed from query_text if no chunk shares a term with the query.
     :param doc_id: The document ID to filter vectors by.
     :param top_k: How many matches to retrieve.
+    :param query_text: The query text, used by lexical and hybrid modes.
+    :param mode: "dense", "lexical" or "hybrid". Lexical and hybrid fall back to dense if the document has no lexical index.
     :return: A list of matches, each match is a dict containing { id, score, metadata }.
     """
+    if mode != "dense" and (query_text is None or not has_lexical_index(doc_id)):
+        mode = "dense"
+
+    if mode == "lexical":
+        matches = query_lexical(query_text, doc_id, top_k=top_k)
+        if matches:
+            return matches
+        # No chunk shares a term with the query, so fall back to dense retrieval rather than return no excerpts
+        print(f"No lexical matches in {doc_id} for {query_text[:80]!r}, falling back to dense retrieval")
+        if query_embedding is None:
+            query_embedding = get_embedding([query_text])[0]
+        return _query_dense(query_embedding, doc_id, top_k)
+
+    if query_embedding is None:
+        raise ValueError("query_embedding is required for dense retrieval")
+
+    if mode == "dense":
+        return _query_dense(query_embedding, doc_id, top_k)
+
+    # Hybrid: fuse both rankings over a larger candidate pool
+    candidates = max(top_k * 4, 20)
+    rankings = [
+        _query_dense(query_embedding, doc_id, candidates),
+        query_lexical(query_text, doc_id, top_k=candidates),
+    ]
+    fused: Dict[str, Dict] = {}
+    for ranking in rankings:
+        for rank, match in enumerate(ranking):
+            entry = fused.setdefault(match["id"], {"id": match["id"], "score": 0.0, "metadata": match["metadata"]})
+            entry["score"] += 1.0 / (RRF_K + rank + 1)
+
+    return sorted(fused.values(), key=lambda match: match["score"], reverse=True)[:top_k]
+
+def _query_dense(query_embedding: List[float], doc_id: str, top_k: int) -> List[Dict]:
+    """
+    Query Pinecone (or the local vector store) for the top-k most similar vectors that belong to a specific document.
+    """
+    if VECTOR_BACKEND == "local":
+        return query_local(query_embedding, doc_id, top_k=top_k)
+
     index = get_pinecone_client()
 
     response = index.query(
@@ -51,4 +164,14 @@ def query_top_k(
         include_metadata=True,
         filter={"doc_id": doc_id},
     )
-    return response["matches"]
\ No newline at end of file
+    if PINECONE_STORE_TEXT:
+        return response["matches"]
+
+    # Text isn't stored in Pinecone, so fill it in from the local copy of the chunks
+    texts = get_chunk_texts(doc_id) or []
+    matches = []
+    for match in response["matches"]:
+        chunk_index = int(match["metadata"]["chunk_index"])
+        metadata = {**match["metadata"], "text": texts[chunk_index] if chunk_index < len(texts) else ""}
+        matches.append({"id": match["id"], "score": match["score"], "metadata": metadata})
+    return matches
@@ -1,12 +1,18 @@
-from typing import Optional, List, Union
+from typing import Optional, List, Union, Tuple, TYPE_CHECKING
 from pydantic import BaseModel
 from typing_extensions import Literal
 import concurrent.futures
+import hashlib
+import time
 
 from .analysis import InsightsReponse, Section, Insight
-from .vector_store import query_top_k
+from .vector_store import query_top_k, needs_query_embedding
 from .embeddings import get_embedding
 from .clients import get_openai_client
+from .chart_routing import CHART_ROUTING, CHART_FAST_MODEL, check_chart_spec, chart_routing_stats
+
+if TYPE_CHECKING:
+    from .cache import VisualizationCache
 
 class ChartBase(BaseModel):
     """
@@ -97,6 +103,9 @@ class VisualModule(BaseModel):
     # The type of visualization (BarChart, PieChart, GaugeChart, SingleStatCard, LineChart, MultiSeriesBarChart)
     chart: ChartSpec
 
+    # True if chart generation failed and the module fell back to a TextCard
+    degraded: bool = False
+
 class VisualSection(BaseModel):
     section_id: str # Unique identifier for this section
     name: str  # e.g. "overview", "risk_factors"
@@ -113,6 +122,29 @@ class VisualResponse(BaseModel):
     risk_factors: VisualSection
     market_position: VisualSection
 
+# (VisualResponse / InsightsReponse field, section name, section id suffix)
+_SECTIONS = [
+    ("overview", "Overview", "overview"),
+    ("operational_performance", "Operational Performance", "op_perf"),
+    ("risk_factors", "Risk Factors", "risk_factors"),
+    ("market_position", "Market Position", "market_pos"),
+]
+
+# (VisualSection field, Section insight field, module id suffix)
+_MODULE_SLOTS = [
+    ("main_module", "main_insight", "main"),
+    ("side_module_1", "side_insight_1", "side1"),
+    ("side_module_2", "side_insight_2", "side2"),
+]
+
+
+def module_cache_key(insight: Insight, section_name: str, section_summary: str, doc_id: str) -> str:
+    """
+    Content hash of everything a module's chart depends on (besides the model).
+    """
+    content = "\x1f".join([doc_id, section_name, section_summary, insight.name, insight.insight_summary])
+    return hashlib.sha256(content.encode()).hexdigest()
+
 
 def make_chart_spec(
     insight: Insight,
@@ -190,10 +222,12 @@ def make_chart_spec(
     {chart_schema_explanation}
     """
 
-    # Get embeddings for insight text
-    emb = get_embedding([insight.name + ' ' + insight.insight_summary])[0]
-    relevant_text = query_top_k(emb, doc_id=doc_id, top_k=3)
-    relevant_text = "\n\n".join([f"<excerpt_{i+1}>\n{t['metadata']['text']} </excerpt_{i+1}>" for i, t in enumerate(relevant_text)])
+    # Get embeddings for insight text (skipped when retrieval is purely lexical)
+    query_text = insight.name + ' ' + insight.insight_summary
+    emb = get_embedding([query_text])[0] if needs_query_embedding(doc_id) else None
+    matches = query_top_k(emb, doc_id=doc_id, top_k=3, query_text=query_text)
+    excerpts = [t['metadata']['text'] for t in matches]
+    relevant_text = "\n\n".join([f"<excerpt_{i+1}>\n{text} </excerpt_{i+1}>" for i, text in enumerate(excerpts)])
 
 
     # User Prompt
@@ -216,6 +250,28 @@ def make_chart_spec(
     2. Fill out all required data fields using information from the excerpts.
     """
 
+    prompt = system_message + '\n\n' + user_message
+
+    # Tiered routing: accept the fast model's chart if it passes the deterministic checks, otherwise escalate
+    if CHART_ROUTING == "tiered" and CHART_FAST_MODEL != model:
+        start = time.monotonic()
+        try:
+            chart_spec = _request_chart_spec(prompt, CHART_FAST_MODEL)
+        except Exception as e:
+            print(f"[ERROR]: Fast model {CHART_FAST_MODEL} failed: {e}")
+            chart_spec = None
+        problems = check_chart_spec(chart_spec, excerpts)
+        chart_routing_stats.record("fast", time.monotonic() - start, escalated=bool(problems))
+        if not problems:
+            return chart_spec
+        print(f"[ROUTING]: Escalating '{insight.name}' to {model}: {'; '.join(problems)}")
+
+    start = time.monotonic()
+    chart_spec = _request_chart_spec(prompt, model)
+    chart_routing_stats.record("reasoning", time.monotonic() - start)
+    return chart_spec
+
+def _request_chart_spec(prompt: str, model: str) -> Optional[ChartSpec]:
     client = get_openai_client()
 
     response = client.beta.chat.completions.parse(
@@ -223,7 +279,7 @@ def make_chart_spec(
         messages=[
             {
                 "role": "user",
-                "content": system_message + '\n\n' + user_message
+                "content": prompt
             }
         ],
         response_format=_ChartSpecAdapter
@@ -245,83 +301,143 @@ def create_visual_module(
     section_summary: str, 
     doc_id: str,
     module_id: str,
-    model: str = 'o3-mini'
+    model: str = 'o3-mini',
+    module_cache: Optional["VisualizationCache"] = None,
+    force: bool = False
 ) -> VisualModule:
-    chart = make_chart_spec(insight, section_name, section_summary, doc_id=doc_id, model=model)
+    cache_key = module_cache_key(insight, section_name, section_summary, doc_id)
+
+    # Reuse a previously generated module for the same insight, unless it is degraded or we are forced to regenerate
+    if module_cache is not None and not force:
+        cached_module = module_cache.get_module(cache_key, model)
+        if cached_module is not None and not cached_module.degraded:
+            return cached_module.model_copy(update={"module_id": module_id})
+
+    try:
+        chart = make_chart_spec(insight, section_name, section_summary, doc_id=doc_id, model=model)
+    except Exception as e:
+        print(f'[ERROR]: Chart spec generation failed for module {module_id}: {e}')
+        chart = None
+
     # If LLM fails or returns None, we can fallback to a simple text card:
-    if not chart:
+    degraded = not chart
+    if degraded:
         print('[ERROR]: Language model failed to generate a chart spec. Fallback to TextCard.')
         chart = TextCard(
             chart_type="text_card",
             title=insight.name,
             description=insight.insight_summary
         )
-    return VisualModule(module_id=module_id, chart=chart)
+    module = VisualModule(module_id=module_id, chart=chart, degraded=degraded)
+
+    if module_cache is not None:
+        module_cache.set_module(cache_key, model, module)
+    return module
 
 
 def make_visualization(
     insights: InsightsReponse,
     doc_id: str,
-    model: str = 'o3-mini'
+    model: str = 'o3-mini',
+    module_cache: Optional["VisualizationCache"] = None
 ) -> VisualResponse:
 
-    def process_section(section_name: str, section: Section, section_id: str, doc_id: str, model: str = 'o3-mini') -> VisualSection:
+    def process_section(section_name: str, section: Section, section_id: str) -> VisualSection:
         # Do LLM visualization creation in parallel for the Section
         with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-            future_main = executor.submit(
-                create_visual_module,
-                insight = section.main_insight,
-                section_name = section_name,
-                section_summary = section.summary,
-                doc_id = doc_id,
-                module_id = f"{section_id}-main",
-                model=model
-            )
-            future_side1 = executor.submit(
-                create_visual_module,
-                insight = section.side_insight_1,
-                section_name = section_name,
-                section_summary = section.summary,
-                doc_id = doc_id,
-                module_id = f"{section_id}-side1",
-                model=model
-            )
-            future_side2 = executor.submit(
-                create_visual_module,
-                insight = section.side_insight_2,
-                section_name = section_name,
-                section_summary = section.summary,
-                doc_id = doc_id,
-                module_id = f"{section_id}-side2",
-                model=model
-            )
+            futures = {
+                module_field: executor.submit(
+                    create_visual_module,
+                    insight = getattr(section, insight_field),
+                    section_name = section_name,
+                    section_summary = section.summary,
+                    doc_id = doc_id,
+                    module_id = f"{section_id}-{suffix}",
+                    model = model,
+                    module_cache = module_cache
+                )
+                for module_field, insight_field, suffix in _MODULE_SLOTS
+            }
 
             # Get results
-            main_module = future_main.result()
-            side_module_1 = future_side1.result()
-            side_module_2 = future_side2.result()
+            modules = {module_field: future.result() for module_field, future in futures.items()}
 
         return VisualSection(
             section_id=section_id,
             name=section_name,
             summary=section.summary,
-            main_module=main_module,
-            side_module_1=side_module_1,
-            side_module_2=side_module_2
+            **modules
         )
 
     # Process each of the sections
-    overview_sec = process_section("Overview", insights.overview, f'{doc_id}-overview', doc_id=doc_id, model=model)
-    op_perf_sec = process_section("Operational Performance", insights.operational_performance, f'{doc_id}-op_perf', doc_id=doc_id, model=model)
-    risk_factors_sec = process_section("Risk Factors", insights.risk_factors, f'{doc_id}-risk_factors', doc_id=doc_id, model=model)
-    market_pos_sec = process_section("Market Position", insights.market_position, f'{doc_id}-market_pos', doc_id=doc_id, model=model)
+    sections = {
+        section_field: process_section(section_name, getattr(insights, section_field), f'{doc_id}-{suffix}')
+        for section_field, section_name, suffix in _SECTIONS
+    }
 
     # Construct the final VisualResponse
     return VisualResponse(
         response_id=doc_id,
         company_name=insights.company_name,
-        overview=overview_sec,
-        operational_performance=op_perf_sec,
-        risk_factors=risk_factors_sec,
-        market_position=market_pos_sec
-    )
\ No newline at end of file
+        **sections
+    )
+
+
+def visualization_module_ids(visualization: VisualResponse) -> List[str]:
+    """
+    The IDs of all modules of a visualization, in section order.
+    """
+    return [
+        getattr(getattr(visualization, section_field), module_field).module_id
+        for section_field, _, _ in _SECTIONS
+        for module_field, _, _ in _MODULE_SLOTS
+    ]
+
+def regenerate_modules(
+    visualization: VisualResponse,
+    insights: InsightsReponse,
+    doc_id: str,
+    model: str = 'o3-mini',
+    module_cache: Optional["VisualizationCache"] = None,
+    module_ids: Optional[List[str]] = None
+) -> Tuple[VisualResponse, List[str]]:
+    """
+    Regenerate only some modules of an existing visualization, reusing its insights.
+    :param module_ids: Modules to regenerate. If None, all degraded modules are regenerated.
+    :return: The patched visualization and the IDs of the regenerated modules.
+    """
+    targets = []
+    for section_field, section_name, _ in _SECTIONS:
+        visual_section = getattr(visualization, section_field)
+        section = getattr(insights, section_field)
+        for module_field, insight_field, _ in _MODULE_SLOTS:
+            module = getattr(visual_section, module_field)
+            selected = module.module_id in module_ids if module_ids is not None else module.degraded
+            if selected:
+                targets.append((section_field, module_field, section_name, section, getattr(section, insight_field), module.module_id))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [
+            executor.submit(
+                create_visual_module,
+                insight = insight,
+                section_name = section_name,
+                section_summary = section.summary,
+                doc_id = doc_id,
+                module_id = module_id,
+                model = model,
+                module_cache = module_cache,
+                force = True
+            )
+            for _, _, section_name, section, insight, module_id in targets
+        ]
+        new_modules = [future.result() for future in futures]
+
+    # Patch the regenerated modules into their sections
+    section_updates = {}
+    for (section_field, module_field, *_), module in zip(targets, new_modules):
+        visual_section = section_updates.get(section_field, getattr(visualization, section_field))
+        section_updates[section_field] = visual_section.model_copy(update={module_field: module})
+
+    patched = visualization.model_copy(update=section_updates)
+    return patched, [module_id for *_, module_id in targets]
@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+from app.services.chart_routing import check_chart_spec
+
+# Chart specs are plain attribute holders here: app.services.visualize, where the models live, creates API clients
+# on import. check_chart_spec only reads attributes.
+EXCERPTS = [
+    "Net revenue was $1,234 million in fiscal 2023, up from $1,100 million in fiscal 2022.",
+    "Gross margin improved to 42.5% and we ended the year with 272 stores.",
+]
+
+
+def bar_chart(x_labels, y_values):
+    return SimpleNamespace(chart_type="bar_chart", x_labels=x_labels, y_values=y_values)
+
+
+def test_passes_values_found_in_excerpts():
+    assert check_chart_spec(bar_chart(["2022", "2023"], [1100.0, 1234.0]), EXCERPTS) == []
+
+
+def test_matches_values_charted_in_other_units():
+    # $1,234 million charted in billions, 42.5% charted as a fraction
+    assert check_chart_spec(bar_chart(["Revenue", "Margin"], [1.234, 0.425]), EXCERPTS) == []
+
+
+def test_flags_label_value_length_mismatch():
+    problems = check_chart_spec(bar_chart(["2022", "2023"], [1100.0]), EXCERPTS)
+    assert problems == ["2 x_labels but 1 y_values"]
+
+
+def test_flags_gauge_value_outside_range():
+    gauge = SimpleNamespace(chart_type="gauge_chart", min_value=0.0, max_value=100.0, current_value=142.5)
+    assert "current_value outside [min_value, max_value]" in check_chart_spec(gauge, EXCERPTS)
+
+
+def test_flags_values_missing_from_excerpts():
+    problems = check_chart_spec(bar_chart(["2022", "2023"], [1100.0, 987.0]), EXCERPTS)
+    assert problems == ["only 1/2 values appear in the excerpts"]
+
+
+def test_flags_missing_chart_and_text_card():
+    assert check_chart_spec(None, EXCERPTS) == ["no chart spec returned"]
+    assert check_chart_spec(SimpleNamespace(chart_type="text_card"), EXCERPTS) == ["fell back to a text card"]
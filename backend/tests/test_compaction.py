@@ -0,0 +1,94 @@
+from typing import List
+
+import pytest
+
+from app.services import compaction
+from app.services.compaction import scan_pdf, iter_compacted_pages
+
+RUNNING_HEADER = "Table of Contents"
+PROSE = (
+    "We sell our products through company-operated stores, licensed stores and online channels. "
+    "Our customers value convenience, and we continue to invest in the store experience across our markets."
+)
+
+
+@pytest.fixture(autouse=True)
+def word_token_counts(monkeypatch):
+    # The report only needs relative token counts, and tiktoken would download its encoding
+    monkeypatch.setattr(compaction, "num_tokens_from_string", lambda text: len(text.split()))
+
+
+@pytest.fixture
+def pdf_pages(monkeypatch):
+    """
+    Serve the given page texts as the pages of any PDF, in place of pdfplumber.
+    """
+    pages: List[str] = []
+    monkeypatch.setattr(compaction, "iter_text_from_pdf", lambda file_path: iter(pages))
+    return pages
+
+
+def _page(number: int, *body: str) -> str:
+    return "\n".join([RUNNING_HEADER, "Acme Corporation", *body, str(number)])
+
+
+def _filing(*content_pages: str) -> List[str]:
+    filler = [_page(number, PROSE, PROSE) for number in range(10, 14)]
+    return [*content_pages, *filler]
+
+
+def _compact(pdf_pages: List[str], pages: List[str]) -> List[str]:
+    # The same two streaming passes as uploads and bulk ingestion
+    pdf_pages.extend(pages)
+    scan = scan_pdf("filing.pdf")
+    return list(iter_compacted_pages("filing.pdf", scan.boilerplate))
+
+
+def test_drops_table_of_contents_page(pdf_pages, capsys):
+    toc = _page(
+        2,
+        "PART I",
+        "Item 1. Business 4",
+        "Item 1A. Risk Factors 12",
+        "Item 1B. Unresolved Staff Comments 25",
+        "Item 2. Properties 26",
+        "PART II",
+        "Item 7. Management's Discussion and Analysis ..... 35",
+        "Item 8. Financial Statements and Supplementary Data 52",
+    )
+    pages = _filing(toc)
+    chunks = _compact(pdf_pages, pages)
+
+    assert len(chunks) == len(pages) - 1
+    assert not any("Unresolved Staff Comments" in chunk for chunk in chunks)
+    # Only the running header, company name and page number of each page count as removed lines
+    assert f"{3 * len(pages)} boilerplate lines removed" in capsys.readouterr().out
+
+
+def test_keeps_content_pages_with_running_table_of_contents_header(pdf_pages):
+    store_counts = _page(
+        30,
+        "Human Capital",
+        "As of fiscal year end we operated stores in the following regions:",
+        "Americas 272",
+        "Europe 117",
+        "Asia Pacific 85",
+        "Middle East and Africa 14",
+        "Our employees are located in more than 40 countries.",
+    )
+    prose = _page(
+        31,
+        "Our products are sold in over 100",
+        "countries and territories through a network of",
+        "distributors, with the largest share of revenue in",
+        "North America, followed by Europe and",
+        "the Asia Pacific region, where we opened",
+        "new stores during the year.",
+    )
+    pages = _filing(store_counts, prose)
+    chunks = _compact(pdf_pages, pages)
+
+    assert len(chunks) == len(pages)
+    assert "Americas 272" in chunks[0]
+    assert "Our products are sold in over 100" in chunks[1]
+    assert not any(RUNNING_HEADER in chunk for chunk in chunks)
@@ -31,7 +31,10 @@ export async function POST(request: NextRequest) {
 
     // Otherwise, parse and return the JSON from FastAPI
     const data = await fastApiRes.json();
-    return NextResponse.json(data, { status: 200 });
+    // Cached visualizations name their versioned URL, which is proxied to FastAPI at the same path
+    const contentLocation = fastApiRes.headers.get("content-location");
+    const headers = contentLocation ? { "Content-Location": contentLocation } : undefined;
+    return NextResponse.json(data, { status: 200, headers });
 
   } catch (error: any) {
     console.error("Error in /api/generate-visualization:", error);
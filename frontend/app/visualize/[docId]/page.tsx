@@ -19,6 +19,14 @@ const SECTIONS: Section[] = [
   { id: "market", label: "Market Performance", icon: "📈" },
 ];
 
+// Remember the versioned URL of a visualization, so the next visit can load it from the browser cache
+function rememberVersion(versionKey: string, res: Response) {
+  const versionedUrl = res.headers.get("content-location");
+  if (versionedUrl) {
+    localStorage.setItem(versionKey, versionedUrl);
+  }
+}
+
 export default function VisualizePage() {
   const [visualData, setVisualData] = useState<VisualResponse | null>(null);
   const [error, setError] = useState<string>("");
@@ -52,18 +60,48 @@ export default function VisualizePage() {
       inFlightRef.current.add(docId);
       
       try {
-        const res = await fetch("/api/generate-visualization", {
-          method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({ doc_id: docId }),
-        });
+        const latestUrl = `/visualizations/${encodeURIComponent(docId)}`;
+        const versionKey = `visualization-version:${docId}`;
+
+        // A versioned URL never changes, so the browser serves it from its cache without a request
+        const versionedUrl = localStorage.getItem(versionKey);
+        let res = versionedUrl ? await fetch(versionedUrl) : null;
+        const fromVersionedUrl = res !== null && res.ok;
+
+        if (!res || !res.ok) {
+          // The latest version, revalidated by the browser with its ETag
+          res = await fetch(latestUrl);
+        }
+
+        // Not generated yet, so generate it
+        if (res.status === 404) {
+          res = await fetch("/api/generate-visualization", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ doc_id: docId }),
+          });
+        }
 
         if (!res.ok) {
           throw new Error(`Failed to fetch visualization for docId=${docId}`);
         }
+        rememberVersion(versionKey, res);
         const data = await res.json();
         setVisualData(data);
         fetchedRef.current[docId] = data;
+        setIsLoading(false);
+
+        // Modules may have been regenerated since the version we showed: check after rendering it
+        if (fromVersionedUrl) {
+          const latest = await fetch(latestUrl);
+          const latestVersion = latest.ok ? latest.headers.get("content-location") : null;
+          if (latestVersion && latestVersion !== versionedUrl) {
+            rememberVersion(versionKey, latest);
+            const latestData = await latest.json();
+            setVisualData(latestData);
+            fetchedRef.current[docId] = latestData;
+          }
+        }
       } catch (err: any) {
         setError(err.message);
         // Reset fetched status on error so we can try again
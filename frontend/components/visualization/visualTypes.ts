@@ -3,6 +3,8 @@ import { ChartSpec } from "../charts/chartTypes";
 export interface VisualModule {
   module_id: string;
   chart: ChartSpec;
+  // True if chart generation failed and the module fell back to a text card
+  degraded?: boolean;
 }
 
 export interface VisualSection {
@@ -1,7 +1,18 @@
 import type { NextConfig } from "next";
 
 const nextConfig: NextConfig = {
-  /* config options here */
+  async rewrites() {
+    const backendUrl = process.env.BACKEND_API_URL;
+    if (!backendUrl) {
+      return [];
+    }
+    // Cached visualizations are proxied to FastAPI as-is: its precompressed bodies, ETags and Cache-Control
+    // reach the browser unchanged, and its Content-Location (/visualizations/{docId}/{version}) resolves here too
+    return [
+      { source: "/visualizations/:docId", destination: `${backendUrl}/visualizations/:docId` },
+      { source: "/visualizations/:docId/:version", destination: `${backendUrl}/visualizations/:docId/:version` },
+    ];
+  },
 };
 
 export default nextConfig;